@@ -0,0 +1,190 @@
+"""
+Players which can take a seat at a rummy.Game, and a registry to make them by name.
+
+An agent decides each part of its turn separately (choose_draw, choose_meld until it returns None, then choose_discard)
+from its read-only rummy.GameView, and take_turn plays a whole turn on the game. Ginny fits this already; the baselines here are much cheaper opponents,
+and reference points when measuring how strong Ginny is:
+    random: plays uniformly random legal moves
+    greedy: minimises its deadwood with hand_solver, melding everything it can
+"""
+import random
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Sequence
+from typing import Callable, Protocol
+
+import hand_solver
+import rummy
+
+
+RANDOM_MELD_PROBABILITY = 0.5 # Chance the random agent lays each legal meld it could, rather than stopping
+
+
+class Agent(Protocol):
+    game : rummy.Game
+    player : int
+    view : rummy.GameView
+
+    def choose_draw(self) -> bool:
+        """
+        Whether to draw from the deck rather than pick up the discard
+        """
+        ...
+
+    def choose_meld(self) -> tuple[int, ...] | None:
+        """
+        Hand indices of the next cards to meld, or None to stop melding
+        """
+        ...
+
+    def choose_discard(self) -> int:
+        """
+        Hand index of the card to discard
+        """
+        ...
+
+    def take_turn(self) -> None:
+        ...
+
+
+AgentFactory = Callable[..., Agent]
+
+AGENTS : dict[str, AgentFactory] = {}
+
+
+def register_agent(name:str) -> Callable[[AgentFactory], AgentFactory]:
+    def register(factory:AgentFactory) -> AgentFactory:
+        AGENTS[name] = factory
+        return factory
+    return register
+
+def make_agent(name:str, game:rummy.Game, player:int, **kwargs) -> Agent:
+    """
+    Make a registered agent for a seat. Keyword arguments are passed on to its factory, eg human_delay.
+    """
+    if not name in AGENTS:
+        raise ValueError(f"Unknown agent {name!r}; choose from {', '.join(AGENTS)}")
+
+    return AGENTS[name](game, player, **kwargs)
+
+
+class BaseAgent(ABC):
+    """
+    Plays a turn from the choose_ methods, which subclasses must fill in
+    """
+    def __init__(self, game:rummy.Game, player:int, human_delay:float=0) -> None:
+        self.game = game
+        self.player = player
+        self.view = game.get_view(player)
+        self.human_delay = human_delay
+
+    @abstractmethod
+    def choose_draw(self) -> bool:
+        ...
+
+    @abstractmethod
+    def choose_meld(self) -> tuple[int, ...] | None:
+        ...
+
+    @abstractmethod
+    def choose_discard(self) -> int:
+        ...
+
+    def take_turn(self) -> None:
+        time.sleep(self.human_delay)
+        self.game.draw(self.player, from_deck=self.choose_draw())
+
+        combo = self.choose_meld()
+        while not combo is None:
+            time.sleep(self.human_delay)
+            self.game.lay_meld(self.player, combo)
+            combo = self.choose_meld()
+
+        time.sleep(self.human_delay)
+        self.game.discard(self.player, self.choose_discard())
+
+
+@register_agent("random")
+class RandomAgent(BaseAgent):
+    def __init__(self, game:rummy.Game, player:int, human_delay:float=0, rng:random.Random|None=None) -> None:
+        super().__init__(game, player, human_delay)
+        self.rng = random if rng is None else rng
+
+    def choose_draw(self) -> bool:
+        legal_actions = self.view.legal_actions
+        if not legal_actions.draw_from_discard:
+            return True
+        return self.rng.random() < 0.5
+
+    def choose_meld(self) -> tuple[int, ...] | None:
+        legal_melds = self.view.legal_actions.melds
+        if len(legal_melds) == 0 or self.rng.random() >= RANDOM_MELD_PROBABILITY:
+            return None
+        return self.rng.choice(legal_melds)
+
+    def choose_discard(self) -> int:
+        discard_mask = self.view.legal_actions.discard_mask
+        return self.rng.choice([i for i in range(discard_mask.bit_length()) if discard_mask >> i & 1])
+
+
+@register_agent("greedy")
+class GreedyAgent(BaseAgent):
+    """
+    Keeps its deadwood as low as possible: picks up the discard if that would lower its deadwood after discarding, lays
+    every meld and extension in its best partition, and discards its highest scoring deadwood card
+    """
+    def choose_draw(self) -> bool:
+        if not self.view.legal_actions.draw_from_discard:
+            return True
+
+        hand = self.view.hand
+        current = self.solve(hand)
+        with_discard = self.solve([*hand, self.view.discard_top])
+
+        # Drawing from the deck could at worst mean discarding the drawn card, keeping the current deadwood
+        return self.get_deadwood_after_discard(with_discard) >= current.deadwood
+
+    def choose_meld(self) -> tuple[int, ...] | None:
+        hand = self.view.hand
+        legal_melds = set(self.view.legal_actions.melds)
+        partition = self.solve(hand)
+
+        for cards in partition.melds + [cards for _, cards in partition.extensions]:
+            combo = tuple(sorted(hand.index(card) for card in cards))
+            if combo in legal_melds:
+                return combo
+
+        return None
+
+    def choose_discard(self) -> int:
+        hand = self.view.hand
+        partition = self.solve(hand)
+
+        # Everything melds, so break up a meld; the highest scoring card is the least bad one to give away
+        candidates = partition.deadwood_cards if len(partition.deadwood_cards) > 0 else hand
+
+        return hand.index(max(candidates, key=lambda card: hand_solver.CARD_SCORES_BY_INDEX[rummy.CARD_INDICES[card]]))
+
+    def solve(self, hand:Sequence[str]) -> hand_solver.HandPartition:
+        table = self.view.table
+        return hand_solver.solve_hand(hand, table.melds, table.meld_types)
+
+    @staticmethod
+    def get_deadwood_after_discard(partition:hand_solver.HandPartition) -> int:
+        if len(partition.deadwood_cards) == 0:
+            return 0
+        return partition.deadwood - max(hand_solver.CARD_SCORES_BY_INDEX[rummy.CARD_INDICES[card]] for card in partition.deadwood_cards)
+
+
+@register_agent("ginny")
+def make_ginny(game:rummy.Game, player:int, human_delay:float=0, genome_file:str|None=None, config_file:str|None=None,
+               **kwargs) -> Agent:
+    """
+    Ginny with the saved genome, unless other files are given. Imported here so the baselines don't need neat.
+    """
+    import ginny
+
+    genome = ginny.Ginny.get_genome() if genome_file is None else ginny.Ginny.get_genome(genome_file)
+    config = ginny.Ginny.get_config() if config_file is None else ginny.Ginny.get_config(config_file)
+
+    return ginny.Ginny(game, player, genome, config, human_delay=human_delay, **kwargs)
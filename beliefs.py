@@ -0,0 +1,207 @@
+"""
+Each player's beliefs about which cards the other players are holding.
+
+A BeliefTracker listens to a game's events and keeps Knowledge.beliefs up to date for every player: a 52 x num_players
+array where beliefs[c, q] is the probability, from that player's point of view, that card c (index into rummy.DECK) is in
+player q's hand. Whatever probability is left over in a row is the chance the card is in the deck.
+
+Cards whose location a player doesn't know make up their pool (the deck plus the cards in other hands they haven't seen).
+Updates, all vectorised over the pool:
+    - drawing from the deck moves each pool card into the drawer's hand with probability P(in deck) / deck size
+    - discarding or melding an unseen card takes one unknown card out of the player's hand, so their column is rescaled
+    - picking up a discard makes the cards which meld with it more likely to be in the player's hand, and discarding a
+      card makes them less likely (PICKUP_FRIEND_WEIGHT and DISCARD_FRIEND_WEIGHT)
+After each update the pool is rebalanced so each hand and the deck hold the right number of cards (see normalise).
+
+Tracking is opt-in: attach a BeliefTracker to the games which need it, e.g. for a human-facing or search-based player.
+"""
+import numpy as np
+
+import rummy
+
+
+PICKUP_FRIEND_WEIGHT = 2.0
+DISCARD_FRIEND_WEIGHT = 0.5
+NORMALISE_ITERATIONS = 20 # Close to certain hands converge slowly, so this is a cap rather than a guarantee
+NORMALISE_TOLERANCE = 1e-6
+
+# Indices of the cards which could be in a meld with each card
+FRIEND_INDICES : list[np.ndarray] = [
+    np.array([rummy.CARD_INDICES[friend] for friend in rummy.Game.get_possible_meld_friends(card)])
+    for card in rummy.DECK]
+
+
+class BeliefTracker:
+    def __init__(self, game:rummy.Game) -> None:
+        self.game = game
+
+        # For each player, their beliefs and which cards are in their pool
+        self.beliefs : list[np.ndarray] = []
+        self.pools : list[np.ndarray] = []
+        self.deck_size = 0
+
+        game.add_listener(self.on_event)
+
+    def close(self) -> None:
+        self.game.remove_listener(self.on_event)
+
+    def on_event(self, event:rummy.GameEvent) -> None:
+        if isinstance(event, rummy.DealtEvent):
+            self.on_deal(event)
+            return
+
+        if not self.beliefs:
+            # Game was dealt before the tracker was attached
+            return
+
+        if isinstance(event, rummy.DrewFromDeckEvent):
+            self.on_draw_from_deck(event.player, rummy.CARD_INDICES[event.card])
+        elif isinstance(event, rummy.DrewFromDiscardEvent):
+            card = rummy.CARD_INDICES[event.card]
+            for beliefs in self.beliefs:
+                beliefs[card] = 0
+                beliefs[card, event.player] = 1
+            self.reweight_friends(event.player, card, PICKUP_FRIEND_WEIGHT)
+        elif isinstance(event, rummy.DiscardedEvent):
+            card = rummy.CARD_INDICES[event.card]
+            self.reveal([card])
+            self.reweight_friends(event.player, card, DISCARD_FRIEND_WEIGHT)
+        elif isinstance(event, (rummy.MeldLaidEvent, rummy.MeldExtendedEvent, rummy.MeldRearrangedEvent)):
+            self.reveal([rummy.CARD_INDICES[card] for card in event.cards])
+        elif isinstance(event, rummy.ReshuffledEvent):
+            # The old discard pile is now the deck, so those cards are back in everyone's pool, and certainly not in a hand
+            deck = [rummy.CARD_INDICES[card] for card in event.deck]
+            for beliefs, pool in zip(self.beliefs, self.pools):
+                beliefs[deck] = 0
+                pool[deck] = True
+            self.deck_size = len(deck)
+
+    def on_deal(self, event:rummy.DealtEvent) -> None:
+        num_players = self.game.num_players
+        discard_card = rummy.CARD_INDICES[event.discard_card]
+
+        self.beliefs = []
+        self.pools = []
+        self.deck_size = len(rummy.DECK) - sum(len(hand) for hand in event.hands) - 1
+
+        for player in range(num_players):
+            beliefs = np.zeros((len(rummy.DECK), num_players))
+            pool = np.ones(len(rummy.DECK), dtype=bool)
+
+            own_cards = [rummy.CARD_INDICES[card] for card in event.hands[player]]
+            pool[own_cards] = False
+            pool[discard_card] = False
+            beliefs[own_cards, player] = 1
+
+            # Every card in the pool is equally likely to be in each opponent's hand
+            for opponent in range(num_players):
+                if opponent != player:
+                    beliefs[pool, opponent] = len(event.hands[opponent]) / pool.sum()
+
+            self.beliefs.append(beliefs)
+            self.pools.append(pool)
+            self.game.player_knowledges[player].beliefs = beliefs
+
+    def on_draw_from_deck(self, player:int, card:int) -> None:
+        deck_size = self.deck_size
+        self.deck_size -= 1
+
+        for observer, (beliefs, pool) in enumerate(zip(self.beliefs, self.pools)):
+            if observer == player:
+                # The drawer sees the card, which they might have thought was in an opponent's hand
+                beliefs[card] = 0
+                beliefs[card, player] = 1
+                pool[card] = False
+                self.normalise(observer)
+            else:
+                # Each pool card was the one drawn with probability P(in deck) / deck size
+                in_deck = 1 - beliefs[pool].sum(axis=1)
+                beliefs[pool, player] += in_deck / deck_size
+                self.normalise(observer)
+
+    def reveal(self, cards:list[int]) -> None:
+        """
+        Cards have left a player's hand face up (discarded or melded)
+        """
+        for observer, (beliefs, pool) in enumerate(zip(self.beliefs, self.pools)):
+            beliefs[cards] = 0
+            pool[cards] = False
+            self.normalise(observer)
+
+    def reweight_friends(self, player:int, card:int, weight:float) -> None:
+        for observer, (beliefs, pool) in enumerate(zip(self.beliefs, self.pools)):
+            if observer != player:
+                friends = FRIEND_INDICES[card][pool[FRIEND_INDICES[card]]]
+                beliefs[friends, player] *= weight
+                self.normalise(observer)
+
+    def normalise(self, observer:int) -> None:
+        """
+        Rescale the observer's beliefs over their pool so each opponent's column holds as many cards as the observer hasn't
+        seen in their hand, the deck holds the rest, and every pool card is in exactly one of them. The deck is treated as
+        an extra column and the columns and rows are rescaled alternately until they agree (Sinkhorn iteration).
+        """
+        beliefs = self.beliefs[observer]
+        pool = self.pools[observer]
+
+        opponents = np.arange(self.game.num_players) != observer
+        hand_sizes = np.array([len(hand) for hand in self.game.hands])
+        column_totals = np.append((hand_sizes - beliefs[~pool].sum(axis=0))[opponents], self.deck_size)
+
+        pool_beliefs = beliefs[np.ix_(pool, opponents)]
+        pool_beliefs = np.column_stack((pool_beliefs, np.clip(1 - pool_beliefs.sum(axis=1), 0, None)))
+
+        for _ in range(NORMALISE_ITERATIONS):
+            totals = pool_beliefs.sum(axis=0)
+            pool_beliefs *= np.divide(column_totals, totals, out=np.zeros_like(totals), where=totals > 0)
+
+            row_totals = pool_beliefs.sum(axis=1, keepdims=True)
+            np.divide(pool_beliefs, row_totals, out=pool_beliefs, where=row_totals > 0)
+
+            if np.abs(pool_beliefs.sum(axis=0) - column_totals).max() < NORMALISE_TOLERANCE:
+                break
+
+        beliefs[np.ix_(pool, opponents)] = pool_beliefs[:, :-1]
+
+
+def sample_hands(beliefs:np.ndarray, game:rummy.Game, player:int, rng:np.random.Generator|None=None) -> list[list[str]]:
+    """
+    Sample a full deal of the other players' hands consistent with a player's beliefs. Cards already known to be in a hand
+    are kept; the rest are drawn without replacement, weighted by the beliefs.
+
+    Opponents are filled most constrained first (fewest spare cards they could be holding), so one opponent doesn't take
+    the only cards another could have. If an opponent still runs out of cards with any weight, the rest of their hand is
+    drawn uniformly from the player's remaining pool.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    # The player's pool: cards which aren't in their hand, the discard pile, a meld or known to be in another hand
+    available = np.ones(len(rummy.DECK), dtype=bool)
+    for card in [*game.get_hand(player), *game.discard_pile, *(card for meld in game.melds for card in meld)]:
+        available[rummy.CARD_INDICES[card]] = False
+    available[beliefs.max(axis=1) >= 1] = False
+
+    known = {opponent: np.flatnonzero(beliefs[:, opponent] >= 1) for opponent in range(game.num_players) if opponent != player}
+    num_unseen = {opponent: len(game.get_hand(opponent)) - len(known[opponent]) for opponent in known}
+    sampled : dict[int, np.ndarray] = {}
+
+    while len(sampled) < len(known):
+        opponent = min((opponent for opponent in known if not opponent in sampled),
+                       key=lambda opponent: np.count_nonzero(beliefs[available, opponent] > 0) - num_unseen[opponent])
+
+        weights = beliefs[:, opponent] * available
+        num_weighted = min(num_unseen[opponent], np.count_nonzero(weights > 0))
+        unseen = rng.choice(len(rummy.DECK), size=num_weighted, replace=False, p=weights / weights.sum()) if num_weighted > 0 else np.array([], dtype=int)
+        available[unseen] = False
+
+        if num_weighted < num_unseen[opponent]:
+            rest = rng.choice(np.flatnonzero(available), size=num_unseen[opponent] - num_weighted, replace=False)
+            available[rest] = False
+            unseen = np.append(unseen, rest)
+
+        sampled[opponent] = unseen
+
+    return [game.get_hand(opponent).copy() if opponent == player else
+            [rummy.DECK[card] for card in list(known[opponent]) + list(sampled[opponent])]
+            for opponent in range(game.num_players)]
@@ -0,0 +1,265 @@
+"""
+Micro-benchmarks for the rummy engine and Ginny, across player counts and early/late game states.
+
+Usage:
+    python benchmark.py --save benchmarks/baseline.json
+    python benchmark.py --compare benchmarks/baseline.json
+
+With --compare, any benchmark whose median time has grown by more than --threshold is reported as a regression,
+and the script exits with a non-zero status.
+"""
+import argparse
+import copy
+import gc
+import json
+import random
+import statistics
+import sys
+import time
+from typing import Callable
+
+import rummy
+import hand_solver
+from ginny import Ginny
+
+
+BENCHMARK_SEED = 1234
+NUM_REPEATS = 200
+REGRESSION_THRESHOLD = 0.1 # Fractional slowdown of the median which counts as a regression
+LATE_GAME_TURNS = 20
+STAGES = ["early", "late"]
+
+# Fixed melds for the meld-checking benchmarks
+VALID_RUN = ["Q♣", "K♣", "A♣", "2♣"]
+VALID_SET = ["7♦", "7♥", "7♠"]
+INVALID_MELD = ["7♦", "8♥", "9♠"]
+
+
+def measure(setup:Callable[[], tuple], op:Callable, num_repeats:int) -> list[float]:
+    """
+    Time op(*setup()) num_repeats times, returning the time of each call (secs). All setup is done before any timing, and
+    garbage collection is paused while timing, as the many set-up copies would otherwise make collections land in timed calls.
+    """
+    args_list = [setup() for _ in range(num_repeats)]
+    times : list[float] = []
+
+    gc.collect()
+    gc.disable()
+    try:
+        for args in args_list:
+            start_time = time.perf_counter()
+            op(*args)
+            times.append(time.perf_counter() - start_time)
+    finally:
+        gc.enable()
+
+    return times
+
+
+# --- Game states ---
+
+def make_state(num_players:int, stage:str, seed:int) -> rummy.Game:
+    """
+    Deterministically build a game at the start of a turn; "early" is just after dealing, "late" is LATE_GAME_TURNS turns in
+    """
+    genome = Ginny.get_genome()
+    config = Ginny.get_config()
+
+    while True:
+        random.seed(seed)
+        game = rummy.Game(num_players, human_readable=False)
+        game.shuffle()
+        game.deal()
+
+        if stage == "early":
+            return game
+
+        ginnys = [Ginny(game, i, genome, config, human_delay=0) for i in range(num_players)]
+        while not game.game_ended and game.num_turns_taken < LATE_GAME_TURNS:
+            ginnys[game.whose_go].take_turn()
+
+        if not game.game_ended:
+            return game
+
+        # Game finished too quickly; try another deal
+        seed += 1
+
+def take_card(game:rummy.Game, card:str) -> None:
+    """
+    Remove a card from wherever it is in the game, so it can be placed elsewhere
+    """
+    if card in game.deck:
+        game.deck = [deck_card for deck_card in game.deck if deck_card != card]
+        return
+
+    for pile in [game.discard_pile] + game.hands + game.melds:
+        if card in pile:
+            pile.remove(card)
+            return
+
+def rig_meld_state(game:rummy.Game, kind:str) -> rummy.Game:
+    """
+    Return a copy of a game (at the start of a turn) where the current player has drawn, and holds cards at indices 0 (and 1, 2)
+    which make a fresh meld, extend a meld on the table, or need a meld on the table to be rearranged
+    """
+    game = copy.deepcopy(game)
+    game.draw(game.whose_go)
+
+    if kind == "fresh":
+        table_melds = []
+        hand_cards = ["4♠", "5♠", "6♠"]
+    elif kind == "extension":
+        table_melds = [["8♦", "9♦", "0♦"]]
+        hand_cards = ["J♦"]
+    elif kind == "rearrangement":
+        table_melds = [["3♣", "4♣", "5♣", "6♣"]]
+        hand_cards = ["6♦", "6♥"]
+
+    for card in [card for meld in table_melds for card in meld] + hand_cards:
+        take_card(game, card)
+
+    # Drop any melds on the table which have been broken up by taking cards
+    valid_melds = [game.is_valid_meld(meld)[0] for meld in game.melds]
+    game.melds = [meld for meld, valid in zip(game.melds, valid_melds) if valid] + table_melds
+    game.meld_types = [meld_type for meld_type, valid in zip(game.meld_types, valid_melds) if valid] + ["run"] * len(table_melds)
+
+    hand = game.get_hand()
+    hand[:0] = hand_cards
+
+    return game
+
+
+# --- Benchmarks ---
+
+def run_benchmarks(player_counts:list[int], num_repeats:int=NUM_REPEATS, name_filter:str="") -> dict[str, dict[str, float]]:
+    genome = Ginny.get_genome()
+    config = Ginny.get_config()
+
+    results : dict[str, dict[str, float]] = {}
+
+    def record(name:str, setup:Callable[[], tuple], op:Callable) -> None:
+        if name_filter not in name:
+            return
+
+        times = measure(setup, op, num_repeats)
+        results[name] = {
+            "median_us": statistics.median(times) * 1e6,
+            "mean_us": statistics.mean(times) * 1e6,
+            "min_us": min(times) * 1e6,
+        }
+        print(f"{name:<45} {results[name]['median_us']:>10.1f} µs")
+
+    # Player-independent benchmarks
+    record("is_valid_meld[run]", lambda: (VALID_RUN,), rummy.Game.is_valid_meld)
+    record("is_valid_meld[set]", lambda: (VALID_SET,), rummy.Game.is_valid_meld)
+    record("is_valid_meld[invalid]", lambda: (INVALID_MELD,), rummy.Game.is_valid_meld)
+    record("sort_cards[run meld]", lambda: (VALID_RUN,), lambda cards: rummy.Game.sort_cards(cards, is_meld=True))
+
+    def shuffle_deal(game:rummy.Game) -> None:
+        game.shuffle()
+        game.deal()
+
+    for num_players in player_counts:
+        random.seed(BENCHMARK_SEED)
+        record(f"shuffle_deal[{num_players}p]", lambda: (rummy.Game(num_players, human_readable=False),), shuffle_deal)
+
+        for stage in STAGES:
+            state = make_state(num_players, stage, BENCHMARK_SEED)
+            tag = f"[{num_players}p,{stage}]"
+
+            def copy_state() -> tuple:
+                return (copy.deepcopy(state),)
+
+            def copy_drawn_state() -> tuple:
+                game = copy.deepcopy(state)
+                game.draw(game.whose_go)
+                return (game,)
+
+            def copy_ginny() -> tuple:
+                game = copy.deepcopy(state)
+                ginny = Ginny(game, game.whose_go, genome, config, human_delay=0)
+                return (ginny,)
+
+            # Engine
+            record(f"draw{tag}", copy_state, lambda game: game.draw(game.whose_go))
+            record(f"discard{tag}", copy_drawn_state, lambda game: game.discard(game.whose_go, 0))
+
+            for kind, num_cards in [("fresh", 3), ("extension", 1), ("rearrangement", 2)]:
+                record(f"lay_meld[{kind}]{tag}",
+                       lambda kind=kind: (rig_meld_state(state, kind),),
+                       lambda game, num_cards=num_cards: game.lay_meld(game.whose_go, list(range(num_cards))))
+
+            record(f"sort_cards[hand]{tag}", lambda: (state.get_hand().copy(),), rummy.Game.sort_cards)
+            record(f"update_partial_melds{tag}", copy_drawn_state,
+                   lambda game: game.update_partial_melds(game.whose_go, game.get_hand()[:-1], game.get_hand()[-1]))
+
+            def solve_cold(game:rummy.Game) -> None:
+                # Clear the memo so each call does the full search
+                hand_solver._table_memos.clear()
+                hand_solver.solve_player(game, game.whose_go)
+            record(f"solve_hand{tag}", lambda: (state,), solve_cold)
+
+            # Ginny
+            record(f"Ginny.update_card_scores{tag}", copy_ginny, lambda ginny: ginny.update_card_scores())
+
+            def scored_ginny() -> tuple:
+                ginny = copy_ginny()[0]
+                ginny.update_card_scores()
+                return (ginny,)
+            record(f"Ginny.get_card_value{tag}", scored_ginny, lambda ginny: ginny.get_card_value(ginny.game.get_hand(ginny.player)[0]))
+            record(f"Ginny.get_expected_card_value[deck]{tag}", scored_ginny,
+                   lambda ginny: ginny.get_expected_card_value(ginny.game.player_knowledges[ginny.player].deck))
+
+            record(f"Ginny.take_turn{tag}", copy_ginny, lambda ginny: ginny.take_turn())
+
+    return results
+
+
+def compare(results:dict[str, dict[str, float]], baseline:dict[str, dict[str, float]], threshold:float=REGRESSION_THRESHOLD) -> list[str]:
+    """
+    Print the change in median time against a baseline, and return the names of any regressions
+    """
+    regressions : list[str] = []
+
+    print(f"\n{'Benchmark':<45} {'Baseline':>10} {'Current':>10} {'Change':>8}")
+    for name, result in results.items():
+        if not name in baseline:
+            print(f"{name:<45} {'-':>10} {result['median_us']:>10.1f} {'new':>8}")
+            continue
+
+        change = result["median_us"] / baseline[name]["median_us"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = " <-- regression"
+
+        print(f"{name:<45} {baseline[name]['median_us']:>10.1f} {result['median_us']:>10.1f} {change:>+8.1%}{flag}")
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the rummy engine and Ginny")
+    parser.add_argument("--players", type=int, nargs="+", default=list(rummy.NUM_CARDS.keys()), choices=list(rummy.NUM_CARDS.keys()), help="Player counts to benchmark")
+    parser.add_argument("--repeats", type=int, default=NUM_REPEATS, help="Number of timed calls per benchmark")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--save", default=None, help="Save results to this JSON file, eg as a new baseline")
+    parser.add_argument("--compare", default=None, help="Compare results against this baseline JSON file")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="Fractional slowdown which counts as a regression")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.players, args.repeats, args.filter)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=4)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+
+        regressions = compare(results, baseline, args.threshold)
+
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
@@ -0,0 +1,174 @@
+"""
+Population checkpoints for long NEAT runs, saved by a CheckpointStore reporter at the end of every generation.
+
+Most generations are saved as a delta against the generation before: the keys of the population, the genomes which are
+new since then, the fitnesses which changed, and the species and random state. Every snapshot_interval-th save is a full
+snapshot instead, so resuming only has to replay the deltas since the last snapshot. Genomes carried over from the
+previous generation (elites and the species representatives and members) are pickled as references to their keys.
+
+Species sets keep a reference to the population's reporters, including the StatisticsReporter whose history grows every
+generation. Reporters are left out of every checkpoint and the restored species set is given the new population's.
+
+The folder holds:
+    snapshot-<generation>.gz    (generation, config, population, species set, random state)
+    delta-<generation>.gz       (generation, population keys, new genomes, changed fitnesses, species set, random state)
+    index.json                  the latest generation, and the files to load for it, snapshot first
+where <generation> is the generation the saved population plays next. The index is only replaced once a checkpoint has
+been written in full, so an interrupted save leaves the previous checkpoint to resume from.
+"""
+import gzip
+import json
+import os
+import pickle
+import random
+import re
+from itertools import count
+
+import neat
+from neat.reporting import BaseReporter, ReporterSet
+
+
+INDEX_FILE_NAME = "index.json"
+SNAPSHOT_FILE_NAME = "snapshot-{:08d}.gz"
+DELTA_FILE_NAME = "delta-{:08d}.gz"
+CHECKPOINT_FILE_PATTERN = re.compile(r"(?:snapshot|delta)-(\d+)\.gz")
+SNAPSHOT_FILE_PATTERN = re.compile(r"snapshot-(\d+)\.gz")
+COMPRESS_LEVEL = 5
+REPORTERS_ID = "reporters" # Persistent id the reporters are pickled as
+
+
+class CheckpointPickler(pickle.Pickler):
+    """
+    Pickles the given genomes as their keys, and reporters not at all
+    """
+    def __init__(self, file, references:dict[int, int]) -> None:
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.references = references # id of each genome the loader already has -> its key
+
+    def persistent_id(self, obj):
+        if isinstance(obj, ReporterSet):
+            return REPORTERS_ID
+        return self.references.get(id(obj))
+
+class CheckpointUnpickler(pickle.Unpickler):
+    def __init__(self, file, population:dict[int, neat.DefaultGenome]) -> None:
+        super().__init__(file)
+        self.population = population # The population the checkpoint's genome keys refer to
+
+    def persistent_load(self, pid):
+        if pid == REPORTERS_ID:
+            return None
+        return self.population[pid]
+
+
+class CheckpointStore(BaseReporter):
+    def __init__(self, folder:str, snapshot_interval:int=10, max_snapshots:int|None=None) -> None:
+        """
+        Save a snapshot every snapshot_interval generations and deltas in between. If max_snapshots is given, only that
+        many snapshots are kept, along with their deltas.
+        """
+        self.folder = folder
+        self.snapshot_interval = snapshot_interval
+        self.max_snapshots = max_snapshots
+
+        self.generation = 0
+        self.files : list[str] = [] # Files for the latest checkpoint, snapshot first
+        self.previous : dict[int, tuple[neat.DefaultGenome, float | None]] = {} # Genomes and fitnesses in the latest checkpoint
+
+        os.makedirs(folder, exist_ok=True)
+
+    def start_generation(self, generation):
+        self.generation = generation
+
+    def end_generation(self, config, population, species_set):
+        self.save(config, population, species_set, self.generation + 1)
+
+    def save(self, config:neat.Config, population:dict[int, neat.DefaultGenome], species_set:neat.DefaultSpeciesSet,
+             generation:int) -> None:
+        if len(self.files) == 0 or len(self.files) >= self.snapshot_interval:
+            file_name = SNAPSHOT_FILE_NAME.format(generation)
+            data = (generation, config, population, species_set, random.getstate())
+            references = {}
+            self.files = []
+        else:
+            file_name = DELTA_FILE_NAME.format(generation)
+            genomes = {key: genome for key, genome in population.items() if not (key in self.previous and self.previous[key][0] is genome)}
+            fitnesses = {key: genome.fitness for key, genome in population.items()
+                         if not key in genomes and genome.fitness != self.previous[key][1]}
+            data = (generation, list(population), genomes, fitnesses, species_set, random.getstate())
+            references = {id(genome): key for key, (genome, _) in self.previous.items()}
+
+        self.write_atomically(file_name, lambda f: CheckpointPickler(f, references).dump(data), compress=True)
+        self.files.append(file_name)
+        self.write_atomically(INDEX_FILE_NAME, lambda f: f.write(json.dumps({"generation": generation, "files": self.files}).encode()))
+
+        self.previous = {key: (genome, genome.fitness) for key, genome in population.items()}
+
+        if self.max_snapshots is not None and len(self.files) == 1:
+            self.prune()
+
+    def write_atomically(self, file_name:str, write, compress:bool=False) -> None:
+        path = os.path.join(self.folder, file_name)
+        temp_path = path + ".tmp"
+
+        with (gzip.open(temp_path, "wb", compresslevel=COMPRESS_LEVEL) if compress else open(temp_path, "wb")) as f:
+            write(f)
+        os.replace(temp_path, path)
+
+    def prune(self) -> None:
+        """
+        Delete the snapshots beyond the newest max_snapshots, and their deltas
+        """
+        snapshots = sorted(int(match.group(1)) for match in map(SNAPSHOT_FILE_PATTERN.fullmatch, os.listdir(self.folder)) if match)
+        if len(snapshots) <= self.max_snapshots:
+            return
+
+        oldest_kept = snapshots[-self.max_snapshots]
+        for file_name in os.listdir(self.folder):
+            match = CHECKPOINT_FILE_PATTERN.fullmatch(file_name)
+            if match and int(match.group(1)) < oldest_kept:
+                os.remove(os.path.join(self.folder, file_name))
+
+    def load(self) -> tuple[int, neat.Config, dict[int, neat.DefaultGenome], neat.DefaultSpeciesSet, object]:
+        """
+        The latest checkpoint's (generation, config, population, species set, random state). Its species set has no reporters.
+        """
+        with open(os.path.join(self.folder, INDEX_FILE_NAME)) as f:
+            index = json.load(f)
+
+        with gzip.open(os.path.join(self.folder, index["files"][0])) as f:
+            generation, config, population, species_set, random_state = CheckpointUnpickler(f, {}).load()
+
+        for file_name in index["files"][1:]:
+            with gzip.open(os.path.join(self.folder, file_name)) as f:
+                generation, keys, genomes, fitnesses, species_set, random_state = CheckpointUnpickler(f, population).load()
+
+            population = {key: genomes[key] if key in genomes else population[key] for key in keys}
+            for key, fitness in fitnesses.items():
+                population[key].fitness = fitness
+
+        self.files = index["files"]
+        self.previous = {key: (genome, genome.fitness) for key, genome in population.items()}
+
+        return generation, config, population, species_set, random_state
+
+    def restore(self) -> neat.Population:
+        """
+        Resume from the latest checkpoint. Falls back to the newest neat.Checkpointer file in the folder if there's no index.
+        """
+        if os.path.exists(os.path.join(self.folder, INDEX_FILE_NAME)):
+            generation, config, population, species_set, random_state = self.load()
+            random.setstate(random_state)
+            p = neat.Population(config, (population, species_set, generation))
+        else:
+            legacy_files = [file_name for file_name in os.listdir(self.folder) if file_name.isdigit()]
+            if len(legacy_files) == 0:
+                raise FileNotFoundError(f"No checkpoints in {self.folder}")
+            p = neat.Checkpointer.restore_checkpoint(os.path.join(self.folder, max(legacy_files, key=int)))
+
+        # Report species to the new population's reporters, and carry on numbering genomes after the existing ones,
+        # rather than from 1 again
+        p.species.reporters = p.reporters
+        p.reproduction.genome_indexer = count(max(p.population) + 1)
+
+        return p
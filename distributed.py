@@ -0,0 +1,285 @@
+"""
+Spread ginny_gym's match evaluation over several machines.
+
+The coordinator runs the NEAT training and listens for workers. Each worker connects over TCP, registers how many processes
+it has, and is sent the NEAT config once; it then repeatedly receives a batch of matches, plays them across its local
+processes and sends the results back. If a worker dies or stops responding mid-batch its matches are put back on the queue
+for the other workers. A match which raises on a worker is reported back as a failure rather than taking the worker down;
+it's retried on the queue, and the training stops if it fails MAX_TASK_ATTEMPTS times.
+
+Connections are authenticated with a shared key, but multiprocessing.connection unpickles whatever an authenticated peer
+sends, so anyone with the key can run code on the other end. The coordinator generates a random key unless one is given,
+and only listens on loopback unless told which address to listen on.
+
+Usage:
+    python distributed.py coordinator --host 0.0.0.0 --port 6100    (prints the key for the workers)
+    python distributed.py --authkey <key> worker coordinator-host --port 6100 --processes 16
+"""
+import argparse
+import os
+import queue
+import secrets
+import socket
+import threading
+import traceback
+from dataclasses import dataclass
+from functools import partial
+from multiprocessing import Pool
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, Listener, answer_challenge, deliver_challenge
+
+import neat
+from tqdm import tqdm
+
+import ginny
+import ginny_gym
+
+
+DEFAULT_PORT = 6100
+DEFAULT_HOST = "127.0.0.1"
+MATCHES_PER_PROCESS = 2 # Batch size sent to a worker, per process it has
+RESULT_TIMEOUT = 600 # secs to wait for a batch's results before giving up on the worker
+MAX_TASK_ATTEMPTS = 3 # Times a match is tried, counting workers lost while playing it, before the training is stopped
+IDLE_CHECK_INTERVAL = 1 # secs between checks that an idle worker is still connected
+
+
+@dataclass
+class MatchTask:
+    generation : int
+    task_id : int
+    genome_group : frozenset
+    attempts : int = 0
+
+
+@dataclass
+class MatchFailure:
+    """
+    Sent back by a worker in place of a MatchResult when playing the match raised
+    """
+    error : str
+
+
+def play_match_or_fail(genome_group:frozenset, config:neat.Config, num_games:int) -> ginny_gym.MatchResult | MatchFailure:
+    try:
+        return ginny_gym.play_match(genome_group, config=config, num_games=num_games)
+    except Exception:
+        return MatchFailure(traceback.format_exc())
+
+
+class Coordinator:
+    """
+    Hands out matches to connected workers. Can be passed to ginny_gym.eval_genomes in place of a local process pool.
+    """
+    def __init__(self, host:str=DEFAULT_HOST, port:int=DEFAULT_PORT, authkey:bytes|None=None) -> None:
+        """
+        Pass host "0.0.0.0" to accept workers from other machines. A random authkey is made if none is given.
+        """
+        self.authkey = secrets.token_hex(16).encode() if authkey is None else authkey
+        # Connections are authenticated in their own threads (see handle_worker), so a client which fails or stalls the
+        # handshake can't stop other workers being accepted
+        self.listener = Listener((host, port))
+        self.address = self.listener.address
+        self.closed = False
+
+        self.tasks : queue.Queue[MatchTask] = queue.Queue()
+        self.results : dict[int, ginny_gym.MatchResult] = {}
+        self.failure : MatchFailure | None = None # Set once a match has failed too many times
+        self.results_changed = threading.Condition()
+
+        self.generation = 0
+        self.config : neat.Config | None = None
+        self.num_games = ginny_gym.NUM_GAMES_PER_MATCH
+
+        threading.Thread(target=self.accept_workers, daemon=True).start()
+
+    def accept_workers(self) -> None:
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                # Listener closed, or the connection was dropped before it was accepted
+                if self.closed:
+                    return
+                continue
+
+            threading.Thread(target=self.handle_worker, args=(conn,), daemon=True).start()
+
+    def handle_worker(self, conn:Connection) -> None:
+        try:
+            deliver_challenge(conn, self.authkey)
+            answer_challenge(conn, self.authkey)
+        except (AuthenticationError, EOFError, OSError) as e:
+            print(f"Rejected connection: {e!r}")
+            conn.close()
+            return
+
+        batch : list[MatchTask] = []
+        delivered = False # Whether the worker has been sent the batch, so it counts as an attempt if the worker is lost
+        sent_config = None
+
+        try:
+            _, name, num_processes = conn.recv()
+            batch_size = max(1, num_processes * MATCHES_PER_PROCESS)
+            print(f"Worker {name} registered with {num_processes} processes")
+
+            while not self.closed:
+                # Wait for a match, checking every so often that the worker hasn't gone. Workers only send results, so
+                # an idle connection with something to read has been closed (or is misbehaving).
+                try:
+                    batch = [self.tasks.get(timeout=IDLE_CHECK_INTERVAL)]
+                except queue.Empty:
+                    if conn.poll():
+                        raise EOFError("Idle worker disconnected")
+                    continue
+
+                # Then take as many more as are ready, up to the batch size
+                while len(batch) < batch_size:
+                    try:
+                        batch.append(self.tasks.get_nowait())
+                    except queue.Empty:
+                        break
+
+                # Drop matches left over from an earlier generation
+                batch = [task for task in batch if task.generation == self.generation]
+                if not batch:
+                    continue
+
+                # The worker may have gone while this was waiting for the matches
+                if conn.poll():
+                    raise EOFError("Idle worker disconnected")
+
+                if not self.config is sent_config:
+                    sent_config = self.config
+                    conn.send(("config", sent_config, self.num_games))
+
+                conn.send(("matches", [(task.task_id, task.genome_group) for task in batch]))
+                delivered = True
+
+                if not conn.poll(RESULT_TIMEOUT):
+                    raise TimeoutError(f"Worker {name} timed out")
+                results = conn.recv()
+
+                with self.results_changed:
+                    for task, (task_id, result) in zip(batch, results):
+                        if task.generation != self.generation:
+                            continue
+                        if isinstance(result, MatchFailure):
+                            print(f"Match {task_id} failed on worker {name}:\n{result.error}")
+                            self.retry(task, result)
+                        else:
+                            self.results[task_id] = result
+                    self.results_changed.notify_all()
+                batch = []
+                delivered = False
+
+        except (EOFError, OSError, TimeoutError) as e:
+            print(f"Lost worker: {e!r}. Re-queueing {len(batch)} matches.")
+            with self.results_changed:
+                for task in batch:
+                    if delivered:
+                        self.retry(task, MatchFailure(f"Lost worker: {e!r}"))
+                    else:
+                        # The worker never saw these matches, so they haven't been tried
+                        self.tasks.put(task)
+                self.results_changed.notify_all()
+        finally:
+            conn.close()
+
+    def retry(self, task:MatchTask, failure:MatchFailure) -> None:
+        """
+        Put a match back on the queue, unless it has failed too often. Call with results_changed held.
+        """
+        task.attempts += 1
+        if task.attempts < MAX_TASK_ATTEMPTS:
+            self.tasks.put(task)
+        elif task.generation == self.generation and self.failure is None:
+            self.failure = failure
+
+    def play_matches(self, genome_groups:list[frozenset], config:neat.Config, num_games:int) -> list[ginny_gym.MatchResult]:
+        """
+        Play the matches on the workers, returning results in the same order as the groups. Blocks until every match is done.
+        Raises RuntimeError if a match fails MAX_TASK_ATTEMPTS times.
+        """
+        with self.results_changed:
+            self.generation += 1
+            self.config = config
+            self.num_games = num_games
+            self.results = {}
+            self.failure = None
+
+        for task_id, genome_group in enumerate(genome_groups):
+            self.tasks.put(MatchTask(self.generation, task_id, genome_group))
+
+        with tqdm(total=len(genome_groups)) as progress:
+            with self.results_changed:
+                while len(self.results) < len(genome_groups) and self.failure is None:
+                    self.results_changed.wait()
+                    progress.update(len(self.results) - progress.n)
+
+                if not self.failure is None:
+                    raise RuntimeError(f"A match failed {MAX_TASK_ATTEMPTS} times:\n{self.failure.error}")
+
+        return [self.results[task_id] for task_id in range(len(genome_groups))]
+
+    def close(self) -> None:
+        self.closed = True
+        self.listener.close()
+
+
+def run_worker(host:str, port:int, authkey:bytes, num_processes:int|None=None) -> None:
+    if num_processes is None:
+        num_processes = os.cpu_count()
+
+    conn = Client((host, port), authkey=authkey)
+    conn.send(("register", f"{socket.gethostname()}:{os.getpid()}", num_processes))
+
+    config = None
+    num_games = ginny_gym.NUM_GAMES_PER_MATCH
+
+    with Pool(num_processes) as pool:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                # Coordinator has finished
+                break
+
+            if message[0] == "config":
+                _, config, num_games = message
+            elif message[0] == "matches":
+                task_ids, genome_groups = zip(*message[1])
+                results = pool.map(partial(play_match_or_fail, config=config, num_games=num_games), genome_groups)
+                conn.send(list(zip(task_ids, results)))
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train Ginny with matches played by workers on other machines")
+    parser.add_argument("--authkey", default=None,
+                        help="Shared secret for connections. Required by workers; the coordinator makes one if not given.")
+    subparsers = parser.add_subparsers(dest="role", required=True)
+
+    coordinator_parser = subparsers.add_parser("coordinator", help="Run the training, handing out matches to workers")
+    coordinator_parser.add_argument("--host", default=DEFAULT_HOST,
+                                    help=f"Address to listen on (default: {DEFAULT_HOST}). Use 0.0.0.0 to accept workers from other machines.")
+    coordinator_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    coordinator_parser.add_argument("--resume", action="store_true", help="Resume from the latest checkpoint")
+
+    worker_parser = subparsers.add_parser("worker", help="Play matches for a coordinator")
+    worker_parser.add_argument("host", help="Coordinator's address")
+    worker_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    worker_parser.add_argument("--processes", type=int, default=None, help="Number of worker processes (default: all cores)")
+    args = parser.parse_args()
+
+    if args.role == "coordinator":
+        coordinator = Coordinator(args.host, args.port, None if args.authkey is None else args.authkey.encode())
+        print(f"Listening on {coordinator.address[0]}:{coordinator.address[1]} with authkey {coordinator.authkey.decode()}")
+        try:
+            ginny_gym.run(ginny.GENOME_FILE_NAME, ginny.CONFIG_FILE_NAME, args.resume, coordinator=coordinator)
+        finally:
+            coordinator.close()
+    else:
+        if args.authkey is None:
+            parser.error("workers need the coordinator's --authkey")
+        run_worker(args.host, args.port, args.authkey.encode(), args.processes)
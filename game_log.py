@@ -0,0 +1,265 @@
+import rummy
+import os
+import mmap
+import struct
+from array import array
+from dataclasses import dataclass
+
+
+# --- File format ---
+# A log file is FILE_MAGIC followed by any number of game records, appended one after another:
+#   uint32 record length (not including itself), uint8 num players, uint8 flags, uint8 starting player,
+#   52 bytes of deck order (card indices into rummy.DECK, as dealt), then the action stream.
+# Each action is one byte; the top 3 bits are the opcode and the bottom 5 bits its argument:
+#   DRAW_DECK, DRAW_DISCARD           - no argument
+#   DISCARD                           - argument is the card index in the hand
+#   MELD                              - argument is the number of cards, followed by that many card index bytes
+#   RESHUFFLE                         - argument unused, followed by a length byte and the new deck order
+#   END                               - argument is 1 if the game was ended early (eg turn limit), 0 if someone went out
+# A sidecar index file (<log>.idx) holds the uint64 offset of every record, for random access to game N.
+FILE_MAGIC : bytes = b"RLOG\x01"
+INDEX_SUFFIX : str = ".idx"
+RECORD_HEADER = struct.Struct("<IBBB")
+
+OP_DRAW_DECK : int = 0
+OP_DRAW_DISCARD : int = 1
+OP_DISCARD : int = 2
+OP_MELD : int = 3
+OP_RESHUFFLE : int = 4
+OP_END : int = 5
+
+FLAG_HUMAN_READABLE : int = 1
+FLAG_ALLOW_REARRANGING : int = 2
+
+
+def encode_action(opcode:int, argument:int=0) -> int:
+    return opcode << 5 | argument
+
+def decode_action(action:int) -> tuple[int, int]:
+    return action >> 5, action & 0x1F
+
+
+class GameRecorder:
+    """
+    Records every game played on a rummy.Game to a log file, by listening to the game's events
+    """
+    def __init__(self, game:rummy.Game, file_name:str) -> None:
+        self.game = game
+        self.file_name = file_name
+
+        # Write the magic bytes if this is a fresh log
+        new_file = not os.path.exists(file_name) or os.path.getsize(file_name) == 0
+        self.file = open(file_name, "ab")
+        self.index_file = open(file_name + INDEX_SUFFIX, "ab")
+        if new_file:
+            self.file.write(FILE_MAGIC)
+            self.file.flush()
+
+        self.record : bytearray | None = None
+
+        game.add_listener(self.on_event)
+
+    def on_event(self, event:rummy.GameEvent) -> None:
+        if isinstance(event, rummy.DealtEvent):
+            # Rebuild the deck order as it was before dealing
+            deck = [card for hand in event.hands for card in hand] + [event.discard_card] + self.game.deck
+
+            flags = (FLAG_HUMAN_READABLE if self.game.human_readable else 0) | (FLAG_ALLOW_REARRANGING if self.game.allow_rearranging else 0)
+
+            self.record = bytearray(RECORD_HEADER.pack(0, self.game.num_players, flags, event.whose_go))
+            self.record += bytes(rummy.CARD_INDICES[card] for card in deck)
+            return
+
+        if self.record is None:
+            # Game was dealt before the recorder was attached
+            return
+
+        if isinstance(event, rummy.DrewFromDeckEvent):
+            self.record.append(encode_action(OP_DRAW_DECK))
+        elif isinstance(event, rummy.DrewFromDiscardEvent):
+            self.record.append(encode_action(OP_DRAW_DISCARD))
+        elif isinstance(event, rummy.DiscardedEvent):
+            self.record.append(encode_action(OP_DISCARD, event.card_index))
+        elif isinstance(event, (rummy.MeldLaidEvent, rummy.MeldExtendedEvent, rummy.MeldRearrangedEvent)):
+            self.record.append(encode_action(OP_MELD, len(event.card_indices)))
+            self.record += bytes(event.card_indices)
+        elif isinstance(event, rummy.ReshuffledEvent):
+            self.record.append(encode_action(OP_RESHUFFLE))
+            self.record.append(len(event.deck))
+            self.record += bytes(rummy.CARD_INDICES[card] for card in event.deck)
+        elif isinstance(event, rummy.GameEndedEvent):
+            self.record.append(encode_action(OP_END, int(event.winner is None)))
+            self.write_record()
+
+    def write_record(self) -> None:
+        # Fill in the record length now that it's known
+        struct.pack_into("<I", self.record, 0, len(self.record) - 4)
+
+        self.index_file.write(struct.pack("<Q", self.file.tell()))
+        self.file.write(self.record)
+
+        self.record = None
+
+    def flush(self) -> None:
+        self.file.flush()
+        self.index_file.flush()
+
+    def close(self) -> None:
+        self.game.remove_listener(self.on_event)
+        self.file.close()
+        self.index_file.close()
+
+
+@dataclass
+class GameRecord:
+    num_players : int
+    human_readable : bool
+    allow_rearranging : bool
+    whose_go : int
+    deck : list[str]
+    actions : bytes
+
+    def get_num_turns(self) -> int:
+        return sum(decode_action(action)[0] == OP_DISCARD for action in self.iter_actions())
+
+    def iter_actions(self):
+        """
+        Yields the first byte of each action, skipping over operand bytes
+        """
+        i = 0
+        while i < len(self.actions):
+            action = self.actions[i]
+            yield action
+
+            opcode, argument = decode_action(action)
+            if opcode == OP_MELD:
+                i += 1 + argument
+            elif opcode == OP_RESHUFFLE:
+                i += 2 + self.actions[i+1]
+            else:
+                i += 1
+
+    def replay(self, max_turns:int|None=None, game:rummy.Game|None=None) -> rummy.Game:
+        """
+        Reconstruct the game by re-applying its actions, without calling any agents.
+        If max_turns is given, stop once that many turns have been completed.
+        A game can be passed in to be reused, as long as it has the same settings as the record.
+        """
+        if game is None:
+            game = rummy.Game(self.num_players, human_readable=self.human_readable, allow_rearranging=self.allow_rearranging, strict=False)
+
+        game.game_ended = True
+        game.shuffle()
+        game.deck = self.deck.copy()
+        game.whose_go = self.whose_go
+        game.deal()
+
+        i = 0
+        while i < len(self.actions):
+            if not max_turns is None and game.num_turns_taken >= max_turns:
+                break
+
+            opcode, argument = decode_action(self.actions[i])
+            i += 1
+
+            if opcode == OP_DRAW_DECK:
+                game.draw(game.whose_go, from_deck=True)
+            elif opcode == OP_DRAW_DISCARD:
+                game.draw(game.whose_go, from_deck=False)
+            elif opcode == OP_DISCARD:
+                game.discard(game.whose_go, argument)
+            elif opcode == OP_MELD:
+                game.lay_meld(game.whose_go, list(self.actions[i : i+argument]))
+                i += argument
+            elif opcode == OP_RESHUFFLE:
+                # The engine has already reshuffled randomly; restore the recorded order
+                length = self.actions[i]
+                deck = [rummy.DECK[card] for card in self.actions[i+1 : i+1+length]]
+                i += 1 + length
+
+                game.deck = deck
+                game.reset_unseen_cards()
+            elif opcode == OP_END:
+                if not game.game_ended:
+                    game.end_game()
+            else:
+                raise ValueError(f"Bad opcode {opcode} at byte {i-1} of game record")
+
+        return game
+
+
+class GameLog:
+    """
+    Read-only, memory-mapped access to a log written by GameRecorder. Supports len() and indexing by game number.
+    """
+    def __init__(self, file_name:str) -> None:
+        self.file_name = file_name
+
+        self.file = open(file_name, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.data[:len(FILE_MAGIC)] != FILE_MAGIC:
+            raise ValueError(f"{file_name} is not a game log")
+
+        self.offsets = self.load_index()
+
+    def load_index(self) -> array:
+        offsets = array("Q")
+
+        index_file_name = self.file_name + INDEX_SUFFIX
+        if os.path.exists(index_file_name):
+            with open(index_file_name, "rb") as f:
+                offsets.frombytes(f.read())
+
+            # Only trust the index if its last record ends exactly at the end of the log
+            if len(offsets) == 0 and len(self.data) == len(FILE_MAGIC):
+                return offsets
+            if len(offsets) > 0 and offsets[-1] + 4 + struct.unpack_from("<I", self.data, offsets[-1])[0] == len(self.data):
+                return offsets
+
+        return self.scan_offsets()
+
+    def scan_offsets(self) -> array:
+        offsets = array("Q")
+
+        offset = len(FILE_MAGIC)
+        while offset + 4 <= len(self.data):
+            offsets.append(offset)
+            offset += 4 + struct.unpack_from("<I", self.data, offset)[0]
+
+        return offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, game_number:int) -> GameRecord:
+        offset = self.offsets[game_number]
+        length, num_players, flags, whose_go = RECORD_HEADER.unpack_from(self.data, offset)
+
+        deck_start = offset + RECORD_HEADER.size
+        actions_start = deck_start + len(rummy.DECK)
+
+        return GameRecord(
+            num_players,
+            bool(flags & FLAG_HUMAN_READABLE),
+            bool(flags & FLAG_ALLOW_REARRANGING),
+            whose_go,
+            [rummy.DECK[card] for card in self.data[deck_start : actions_start]],
+            self.data[actions_start : offset + 4 + length]
+        )
+
+    def __iter__(self):
+        for game_number in range(len(self)):
+            yield self[game_number]
+
+    def close(self) -> None:
+        self.data.close()
+        self.file.close()
+
+
+def replay(file_name:str, game_number:int, max_turns:int|None=None) -> rummy.Game:
+    log = GameLog(file_name)
+    try:
+        return log[game_number].replay(max_turns)
+    finally:
+        log.close()
@@ -1,9 +1,12 @@
 import rummy
+import profiling
 import neat
 import gzip
 import pickle
 import random
 import itertools
+import collections
+import weakref
 import time
 import numpy as np
 from dataclasses import dataclass
@@ -23,6 +26,13 @@ NODE_NAMES = {
      0: "Card\nvalue"
 }
 
+# Cards near each card, and how much closer each one gets for having it in the hand: 2 for a neighbouring rank in the same
+# suit or the same rank in another suit, 1 for two ranks away in the same suit
+PROXIMITIES : dict[str, list[tuple[str, int]]] = {
+    card: [(neighbour, 1) for neighbour in rummy.RUN_NEIGHBOURS_2[card]] +
+          [(neighbour, 2) for neighbour in rummy.RUN_NEIGHBOURS_1[card] + rummy.SAME_RANK_CARDS[card]]
+    for card in rummy.DECK}
+
 
 @dataclass
 class CardKnowledge:
@@ -36,22 +46,66 @@ class CardKnowledge:
     proximity : int = 0
 
 
+@dataclass
+class TableFeatures:
+    """
+    Card features which depend only on the melds on the table, so are the same for every player
+    """
+    melds_version : int
+    # Cards which could be laid straight onto a meld on the table
+    immediate_meld_cards : list[str]
+    melded_cards : set[str]
+
+
+# Table features of each game, shared by all the Ginnys playing it and recomputed only when the melds change
+_table_features : weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def get_table_features(table:rummy.TableView) -> TableFeatures:
+    features = _table_features.get(table)
+    if not features is None and features.melds_version == table.melds_version:
+        return features
+
+    immediate_meld_cards : list[str] = []
+    melds = table.melds
+    for meld, meld_type in zip(melds, table.meld_types):
+        if meld_type == "set" and len(meld) == 3:
+            immediate_meld_cards += [card for card in rummy.SAME_RANK_CARDS[meld[0]] if not card in meld]
+        if meld_type == "run":
+            immediate_meld_cards.append(rummy.RUN_NEIGHBOURS_1[meld[0]][0])
+            immediate_meld_cards.append(rummy.RUN_NEIGHBOURS_1[meld[-1]][1])
+
+    features = TableFeatures(table.melds_version, immediate_meld_cards, set(card for meld in melds for card in meld))
+    _table_features[table] = features
+
+    return features
+
+
 class Ginny:
-    def __init__(self, game:rummy.Game, player:int, genome:neat.DefaultGenome, config:neat.Config, human_delay:float=1) -> None:
+    def __init__(self, game:rummy.Game, player:int, genome:neat.DefaultGenome, config:neat.Config, human_delay:float=1,
+                 nn:neat.nn.FeedForwardNetwork|None=None) -> None:
         self.game = game
         self.player = player
+        # Decisions are made from this; the game itself is only used to make moves
+        self.view = game.get_view(player)
 
         self.human_delay = human_delay
 
+        self.set_genome(genome, config, nn)
+
+        # Initialise card value caching
+        self.card_values : dict[str, CardKnowledge] = {card: CardKnowledge() for card in rummy.DECK}
+    
+    def set_genome(self, genome:neat.DefaultGenome, config:neat.Config, nn:neat.nn.FeedForwardNetwork|None=None) -> None:
+        """
+        Swap in a different genome, so one Ginny can be reused for many matches. A network already built from the genome can be passed in.
+        """
         self.genome = genome
         self.config = config
 
         # Spin up "brain"
-        self.nn = neat.nn.FeedForwardNetwork.create(genome, config)
+        self.nn = neat.nn.FeedForwardNetwork.create(genome, config) if nn is None else nn
 
-        # Initialise card value caching
-        self.card_values : dict[str, CardKnowledge] = {card: CardKnowledge() for card in rummy.DECK}
-    
 
     @staticmethod
     def get_genome(file_name:str=GENOME_FILE_NAME) -> neat.DefaultGenome:
@@ -70,28 +124,26 @@ class Ginny:
 
 
     def update_card_scores(self, include_discard=False) -> None:
+        profiler = profiling.profiler
+        if profiler is not None:
+            profiler.start("rescoring")
+
         # Reset values
         for card in rummy.DECK:
             self.card_values[card] = CardKnowledge()
 
         # Check whether this card can be added directly to a meld
-        for meld, meld_type in zip(self.game.melds, self.game.meld_types):
-            if meld_type == "set" and len(meld) == 3:
-                remaining_suit = (set(rummy.SUITS) - set([card[1] for card in meld])).pop()
-                self.card_values[meld[0][0] + remaining_suit].num_immediate_meld_cards = 1
-            if meld_type == "run":
-                left_number = rummy.NUMBERS[(rummy.NUMBERS.index(meld[0][0]) - 1) % len(rummy.NUMBERS)]
-                right_number = rummy.NUMBERS[(rummy.NUMBERS.index(meld[-1][0]) + 1) % len(rummy.NUMBERS)]
-                for number in [left_number, right_number]:
-                    self.card_values[number + meld[0][1]].num_immediate_meld_cards = 1
+        table_features = get_table_features(self.view.table)
+        for card in table_features.immediate_meld_cards:
+            self.card_values[card].num_immediate_meld_cards = 1
                
         # Get list of cards which are impossible to be drawn (ie NOT in deck, or in other people's hands. Equiv to in melds, discard, or own hand)
-        impossible_friends = [card for meld in self.game.melds for card in meld] + self.game.get_hand(self.player).copy()
+        impossible_friends = table_features.melded_cards.union(self.view.hand)
         if not include_discard:
-            impossible_friends += self.game.discard_pile.copy()
+            impossible_friends.update(self.view.discard_pile)
 
         # Compute values
-        for partial_meld in self.game.get_knowledge(self.player).partial_melds:
+        for partial_meld in self.view.partial_melds:
             possible_meld_cards = len(partial_meld[1])
 
             for card in partial_meld[1]:
@@ -107,24 +159,16 @@ class Ginny:
                     self.card_values[card].num_immediate_meld_cards = 3
 
         # Update proximity score for cards in current hand
-        for card in self.game.get_hand(self.player):
-            # Runs
-            number_index : int = rummy.NUMBERS.index(card[0])
-            len_nums : int = len(rummy.NUMBERS)
-            def get_number_diff_card(difference : int):
-                return rummy.NUMBERS[(number_index + difference) % len_nums] + card[1]
-            self.card_values[get_number_diff_card(-2)].proximity += 1
-            self.card_values[get_number_diff_card(-1)].proximity += 2
-            self.card_values[get_number_diff_card(1)].proximity += 2
-            self.card_values[get_number_diff_card(2)].proximity += 1
-            # Sets
-            for suit in rummy.SUITS:
-                if suit != card[1]:
-                    self.card_values[card[0] + suit].proximity += 2
+        for card in self.view.hand:
+            for neighbour, proximity in PROXIMITIES[card]:
+                self.card_values[neighbour].proximity += proximity
+
+        if profiler is not None:
+            profiler.stop()
         
         # TODO take into account currently melded cards
 
-    def get_card_value(self, card:str) -> float:
+    def get_card_inputs(self, card:str, min_opponent_cards:int|None=None) -> tuple:
         """
         Values to be fed into the network:
         - Number of turns into the game
@@ -137,17 +181,14 @@ class Ginny:
         - Proximity from one of the cards in the hand already
         """
 
-        # Number of turns into the game
-        num_turns_taken = self.game.num_turns_taken
+        # Number of turns into the game and size of the deck aren't inputs at the moment, so aren't looked up
 
         # Min number of opponents' cards
-        min_opponent_cards = min([len(hand) for player, hand in enumerate(self.game.hands) if player != self.player])
-
-        # Size of deck
-        deck_size = len(self.game.deck)
+        if min_opponent_cards is None:
+            min_opponent_cards = self.get_min_opponent_cards()
 
         # Score of card
-        card_score = self.game.get_score([card])
+        card_score = rummy.Game.get_score([card])
 
         # Number of possible melds which this card facilitates
         num_melds = self.card_values[card].num_melds
@@ -161,8 +202,7 @@ class Ginny:
         # Proximity to existing cards in the hand
         proximity = self.card_values[card].proximity
 
-        # Evaluate network
-        inputs = (
+        return (
             # num_turns_taken,
             min_opponent_cards,
             # deck_size,
@@ -172,71 +212,82 @@ class Ginny:
             # num_immediate_meld_cards,
             proximity
         )
+
+    def get_min_opponent_cards(self) -> int:
+        hand_sizes = self.view.hand_sizes
+        del hand_sizes[self.player]
+        return min(hand_sizes)
+
+    def evaluate(self, inputs:tuple) -> float:
+        profiler = profiling.profiler
+        if profiler is not None:
+            profiler.start("network activation")
+
         card_value = self.nn.activate(inputs)
 
+        if profiler is not None:
+            profiler.stop()
+
         return card_value[0]
 
+    def get_card_value(self, card:str) -> float:
+        return self.evaluate(self.get_card_inputs(card))
+
+    def get_expected_card_value(self, cards:list[str]) -> float:
+        """
+        Mean value of a set of cards, eg the unseen cards which could be drawn from the deck. Many of them have identical
+        inputs, so the network is only evaluated once for each distinct set of inputs and weighted by how often it occurs.
+        """
+        min_opponent_cards = self.get_min_opponent_cards()
+        input_counts = collections.Counter(self.get_card_inputs(card, min_opponent_cards) for card in cards)
+
+        return sum(self.evaluate(inputs) * count for inputs, count in input_counts.items()) / len(cards)
 
-    def take_turn(self):
-        time.sleep(self.human_delay)
 
+    def choose_draw(self) -> bool:
+        """
+        Whether to draw from the deck rather than pick up the discard
+        """
         self.update_card_scores(include_discard=True)
         
         # Pick up a card
-        if self.card_values[self.game.discard_pile[-1]].num_immediate_meld_cards > 0:
-            from_deck = False
-        
-        else:
-            min_hand_value = min([self.get_card_value(card) for card in self.game.get_hand(self.player)])
-            discard_value = self.get_card_value(self.game.discard_pile[-1])
+        if self.card_values[self.view.discard_top].num_immediate_meld_cards > 0:
+            return False
 
-            if min_hand_value < discard_value:
-                # Get expectation of deck value
-                expected_deck_value = np.mean([self.get_card_value(card) for card in self.game.get_knowledge(self.player).deck])
+        min_hand_value = min([self.get_card_value(card) for card in self.view.hand])
+        discard_value = self.get_card_value(self.view.discard_top)
 
-                from_deck = expected_deck_value > discard_value
-            
-            else:
-                from_deck = True
+        if min_hand_value < discard_value:
+            # Get expectation of deck value
+            expected_deck_value = self.get_expected_card_value(self.view.unseen_cards)
 
-        # Draw from whichever has the higher expected value
-        self.game.draw(self.player, from_deck=from_deck)
+            return expected_deck_value > discard_value
 
-        time.sleep(self.human_delay)
+        return True
 
-        self.update_card_scores()
-
-        # Meld if possible
+    def choose_meld(self) -> tuple[int, ...] | None:
+        """
+        Hand indices of the next cards to meld, or None to stop melding
+        """
         # TODO make this smarter
-        search_complete = False
-        while not search_complete:
-            meld_success = False
-
-            # Brute force try every combo
-            combos : list[list[int]] = []
-            for i in range(1, min(len(self.game.get_hand()), 4)):
-                combos += list(itertools.combinations(range(len(self.game.get_hand())), i))
-
-            while len(combos) > 0:
-                success = True
-
-                try:
-                    self.game.lay_meld(self.player, combos.pop())
-                except rummy.BadMeldError as e:
-                    success = False
-                
-                if success:
-                    meld_success = True
-                    time.sleep(self.human_delay)
-                    break
-
-            if not meld_success:
-                search_complete = True
+        # Brute force try every combo, skipping those the game says aren't legal
+        legal_melds = set(self.view.legal_actions.melds)
+        hand_size = len(self.view.hand)
+        combos : list[tuple[int, ...]] = []
+        for i in range(1, min(hand_size, 4)):
+            combos += [combo for combo in itertools.combinations(range(hand_size), i) if combo in legal_melds]
 
+        return combos[-1] if len(combos) > 0 else None
+
+    def choose_discard(self) -> int:
+        """
+        Hand index of the card to discard
+        """
         self.update_card_scores()
         
         # Discard lowest value card
-        hand_values = [self.get_card_value(card) for card in self.game.get_hand()]
+        hand = self.view.hand
+        hand_values = [self.get_card_value(card) for card in hand]
         min_hand_value = np.min(hand_values)
         min_indices = np.where(hand_values == min_hand_value)[0]
         
@@ -246,9 +297,68 @@ class Ginny:
         else:
             max_card_score = 0
             for i in min_indices:
-                current_card_score = rummy.Game.get_score([self.game.get_hand()[i]])
+                current_card_score = rummy.Game.get_score([hand[i]])
                 if current_card_score > max_card_score:
                     max_card_score = current_card_score
                     index = i
+
+        return index
+
+    def take_turn(self):
+        profiler = profiling.profiler
+        if profiler is not None:
+            profiler.start("take_turn")
+
+        time.sleep(self.human_delay)
+
+        if profiler is not None:
+            profiler.start("draw decision")
+
+        from_deck = self.choose_draw()
+
+        if profiler is not None:
+            profiler.stop()
+            profiler.start("draw")
+
+        # Draw from whichever has the higher expected value
+        self.game.draw(self.player, from_deck=from_deck)
+
+        if profiler is not None:
+            profiler.stop()
+
+        time.sleep(self.human_delay)
+
+        if profiler is not None:
+            profiler.start("meld search")
+
+        # Meld if possible
+        combo = self.choose_meld()
+        while not combo is None:
+            if profiler is not None:
+                profiler.count("meld attempts")
+
+            try:
+                self.game.lay_meld(self.player, combo)
+            except rummy.BadMeldError as e:
+                if profiler is not None:
+                    profiler.count("meld exceptions")
+                break
+
+            time.sleep(self.human_delay)
+            combo = self.choose_meld()
+
+        if profiler is not None:
+            profiler.stop()
+            profiler.start("discard decision")
+
+        index = self.choose_discard()
+
+        if profiler is not None:
+            profiler.stop()
+            profiler.start("discard")
             
         self.game.discard(self.player, index)
+
+        if profiler is not None:
+            profiler.stop()
+            profiler.stop()
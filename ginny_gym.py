@@ -3,7 +3,12 @@ import neat_utils
 import gzip
 import pickle
 import ginny
+import agents
 import rummy
+import game_log
+import checkpoints
+import profiling
+from shared_population import SharedPopulation
 import os
 from multiprocessing import Pool
 from itertools import combinations
@@ -11,6 +16,11 @@ import time
 import random
 from tqdm import tqdm
 from functools import partial
+from collections import OrderedDict
+from contextlib import nullcontext
+from dataclasses import dataclass
+import statistics
+import math
 
 
 MAX_TURNS_PER_GAME = 300
@@ -20,10 +30,28 @@ PENALTY_PER_TURN = MAX_TURN_PENALTY * NUM_GAMES_PER_MATCH / MAX_TURNS_PER_GAME /
 
 NUM_WORKERS = 16
 CHECKPOINT_FOLDER = "./checkpoints/"
+CHECKPOINT_SNAPSHOT_INTERVAL = 10 # Generations between full snapshots; the ones in between only save what changed
+MAX_CHECKPOINT_SNAPSHOTS = 5 # Older snapshots and their deltas are deleted
+GAME_LOG_FOLDER : str | None = None # Set to a folder to record every training game; each worker writes its own log file
+PROFILE = False # Record per-phase timings in the workers, and print/save them each generation
+PROFILE_FOLDER = "./temp/"
 
 NUM_PLAYERS = 2
 NUM_GAMES_PER_GENOME = 3
 
+# End a match once one genome is significantly ahead, instead of playing all NUM_GAMES_PER_MATCH games. Only saves games in
+# matches long enough for 2^-games to be well under MATCH_DECISION_ALPHA; see is_match_decided
+EARLY_STOPPING = True
+MIN_GAMES_BEFORE_DECISION = 5
+MATCH_DECISION_ALPHA = 0.05 # Most often a match between equal genomes may be decided early, over all the checks in a match
+NETWORK_CACHE_SIZE = 1000 # Networks kept per worker
+SHARED_POPULATION = True # Write each generation's networks to shared memory once, rather than pickling genomes for every match
+
+RACING = True # Spend extra matches on genomes whose rank is uncertain, rather than playing NUM_GAMES_PER_GENOME matches each
+RACING_INITIAL_MATCHES = 1 # Matches per genome before racing
+RACING_Z = 1.0 # How many standard errors from a cut-off a genome's fitness must be for its rank to count as uncertain
+GAME_BUDGET_PER_GENERATION : int | None = None # Max games per generation when racing; None for the same as the fixed schedule
+
 
 def generate_stochastic_groups(genomes, num_games_per_genome, num_players):
     # List to keep track of the number of games each genome has played
@@ -69,18 +97,76 @@ def generate_stochastic_groups(genomes, num_games_per_genome, num_players):
             
     return selected_groups
             
-def play_match(genomes:tuple[int, list[neat.DefaultGenome]], config:neat.Config, num_games:int) -> dict[str, int]:
-    # Create game instantiation
-    game = rummy.Game(len(genomes), human_readable=False)
+@dataclass
+class GameResult:
+    scores : list[int] # Points scored by each seat in this game
+    num_turns : int
+
+@dataclass
+class MatchResult:
+    fitnesses : dict[int, float]
+    num_turns : int
+    num_games : int # Games actually played, which may be fewer than asked for if the match was decided early
+    profile : dict | None
+
+
+# Per-worker objects, reused between matches rather than rebuilt for every one
+worker_games : dict[int, rummy.Game] = {}
+worker_ginnys : dict[int, list[ginny.Ginny]] = {}
+worker_networks : OrderedDict[int, neat.nn.FeedForwardNetwork] = OrderedDict()
+worker_population : SharedPopulation | None = None
+
+
+def attach_population(name:str) -> None:
+    global worker_population
+
+    worker_population = SharedPopulation(name)
+
+
+def get_network(genome_id:int, genome:neat.DefaultGenome, config:neat.Config) -> neat.nn.FeedForwardNetwork:
+    """
+    Genome ids are never reused for a different genome, so a genome's network can be cached by id and shared by all its matches
+    """
+    nn = worker_networks.get(genome_id)
+
+    if nn is None:
+        if not worker_population is None and genome_id in worker_population:
+            nn = worker_population.get_network(genome_id, config)
+        else:
+            nn = neat.nn.FeedForwardNetwork.create(genome, config)
+        worker_networks[genome_id] = nn
+        if len(worker_networks) > NETWORK_CACHE_SIZE:
+            worker_networks.popitem(last=False)
+    else:
+        worker_networks.move_to_end(genome_id)
+
+    return nn
 
-    # Spin up Ginnys
-    ginnys = [ginny.Ginny(game, i, genome[1], config, human_delay=0) for i, genome in enumerate(genomes)]
+def get_match_players(genomes:list[tuple[int, neat.DefaultGenome]], config:neat.Config) -> tuple[rummy.Game, list[ginny.Ginny]]:
+    """
+    Get this worker's game and Ginnys for the number of players, with the match's genomes swapped in
+    """
+    num_players = len(genomes)
+    game = worker_games.get(num_players)
 
-    # Total num turns
-    num_turns = 0
+    if game is None:
+        game = worker_games[num_players] = rummy.Game(num_players, human_readable=False, strict=False)
+        worker_ginnys[num_players] = [ginny.Ginny(game, i, genome, config, human_delay=0, nn=get_network(genome_id, genome, config))
+                                      for i, (genome_id, genome) in enumerate(genomes)]
 
-    # Play games
+    ginnys = worker_ginnys[num_players]
+    for player, (genome_id, genome) in zip(ginnys, genomes):
+        player.set_genome(genome, config, get_network(genome_id, genome, config))
+
+    return game, ginnys
+
+def iter_match(game:rummy.Game, players:list[agents.Agent], num_games:int):
+    """
+    Play up to num_games games, yielding a GameResult as each one finishes. Stop iterating to end the match early.
+    """
     for _ in range(num_games):
+        old_scores = game.scores.copy()
+
         game.shuffle()
         game.deal()
 
@@ -89,55 +175,251 @@ def play_match(genomes:tuple[int, list[neat.DefaultGenome]], config:neat.Config,
                 game.end_game()
                 break
 
-            ginnys[game.whose_go].take_turn()
-
-        # print(f"Game completed in {game.num_turns_taken} turns")
-
-        num_turns += game.num_turns_taken
+            players[game.whose_go].take_turn()
+
+        yield GameResult([new - old for new, old in zip(game.scores, old_scores)], game.num_turns_taken)
+
+def get_sign_flip_p_value(differences:list[int]) -> float:
+    """
+    One-sided p-value for the differences being centred above 0: the fraction of the 2^n ways of flipping their signs
+    whose total is at least the observed total. Exact whenever the differences are symmetric about 0, as they are between
+    equal genomes with the starting seat chosen at random, however skewed the scores are.
+    """
+    # Count the sign patterns giving each total
+    totals : dict[int, int] = {0: 1}
+    for difference in differences:
+        flipped : dict[int, int] = {}
+        for total, count in totals.items():
+            for signed in (difference, -difference):
+                flipped[total + signed] = flipped.get(total + signed, 0) + count
+        totals = flipped
+
+    observed = sum(differences)
+    return sum(count for total, count in totals.items() if total >= observed) / 2**len(differences)
+
+def is_match_decided(results:list[GameResult], num_games:int) -> bool:
+    """
+    Sequential test of whether the seat with the lowest total score so far is ahead of every other seat: a one-sided
+    sign-flip test on the per-game score differences against each other seat, which must all clear the significance level.
+
+    The level is MATCH_DECISION_ALPHA split evenly (Bonferroni) over each check which could end the match early, and over
+    the seats which could have been the leader, so equal genomes end a match early at most MATCH_DECISION_ALPHA of the
+    time. n games can't give a p-value below 2^-n, so short matches are never decided early.
+    """
+    num_played = len(results)
+    if num_played < MIN_GAMES_BEFORE_DECISION:
+        return False
+
+    num_players = len(results[0].scores)
+    num_checks = max(1, num_games - MIN_GAMES_BEFORE_DECISION)
+    alpha = MATCH_DECISION_ALPHA / (num_checks * num_players)
+
+    # Not enough games yet for any result to be significant
+    if 0.5**num_played >= alpha:
+        return False
+
+    totals = [sum(result.scores[seat] for result in results) for seat in range(num_players)]
+    leader = totals.index(min(totals))
+
+    for seat in range(num_players):
+        if seat == leader:
+            continue
+
+        differences = [result.scores[seat] - result.scores[leader] for result in results]
+        if get_sign_flip_p_value(differences) >= alpha:
+            return False
+
+    return True
+
+def play_match(genomes:frozenset[tuple[int, neat.DefaultGenome]], config:neat.Config, num_games:int) -> MatchResult:
+    if PROFILE:
+        profiling.enable().reset()
+
+    genomes = list(genomes)
+    game, ginnys = get_match_players(genomes, config)
+
+    recorder = None
+    if not GAME_LOG_FOLDER is None:
+        recorder = game_log.GameRecorder(game, os.path.join(GAME_LOG_FOLDER, f"games_{os.getpid()}.rlog"))
+
+    # Play games until the match is over, or its outcome is clear. The game is reused by later matches, so the recorder
+    # must come off it even if this match raises.
+    results : list[GameResult] = []
+    try:
+        for result in iter_match(game, ginnys, num_games):
+            results.append(result)
+
+            if EARLY_STOPPING and is_match_decided(results, num_games):
+                break
+    finally:
+        if not recorder is None:
+            recorder.close()
 
-    # print(f"fitnesses: score: {-game.scores[0]}, {-game.scores[1]} length: {-PENALTY_PER_TURN * num_turns:.2f}")
+    num_turns = sum(result.num_turns for result in results)
 
-    fitnesses : dict[str, int] = {
-        genome[0]: -game.scores[i] - PENALTY_PER_TURN * num_turns
-        for i, genome in enumerate(genomes)
+    # Scale up matches which stopped early so that fitnesses are comparable with full matches
+    scale = num_games / len(results)
+    fitnesses : dict[int, float] = {
+        genome_id: (-sum(result.scores[i] for result in results) - PENALTY_PER_TURN * num_turns) * scale
+        for i, (genome_id, _) in enumerate(genomes)
     }
-    # print(f"Num turns: {num_turns}, scores: {game.scores}, length penalty: {PENALTY_PER_TURN * num_turns :.2f}")
-    
-    return fitnesses, num_turns
+
+    return MatchResult(fitnesses, num_turns, len(results), profiling.profiler.to_dict() if PROFILE else None)
 
 
-def eval_genomes(genomes:list[tuple[int,neat.DefaultGenome]], config:neat.Config):
-    # Get game pairings
-    genome_groups = generate_stochastic_groups(genomes, NUM_GAMES_PER_GENOME, NUM_PLAYERS)
+def play_matches(genome_groups:list[frozenset], config:neat.Config, pool) -> list[MatchResult]:
+    """
+    pool is either a local process pool, or a distributed.Coordinator
+    """
+    if hasattr(pool, "play_matches"):
+        return pool.play_matches(genome_groups, config, NUM_GAMES_PER_MATCH)
 
-    # Evaluate pairs using multiprocessing pool
-    print(f"Playing {len(genome_groups)} matches between {len(genomes)} genomes; {NUM_GAMES_PER_GENOME} matches each. {NUM_GAMES_PER_MATCH} games per match.")
+    if SHARED_POPULATION:
+        # Workers read networks from the shared population, so only send genome ids
+        genome_groups = [frozenset((genome_id, None) for genome_id, _ in group) for group in genome_groups]
 
     play_match_partial = partial(play_match, config=config, num_games=NUM_GAMES_PER_MATCH)
+    return list(tqdm(pool.imap(play_match_partial, genome_groups), total=len(genome_groups)))
+
+def get_match_fitnesses(results:list[MatchResult]) -> dict[int, list[float]]:
+    match_fitnesses : dict[int, list[float]] = {}
+    for result in results:
+        for genome_id, fitness in result.fitnesses.items():
+            match_fitnesses.setdefault(genome_id, []).append(fitness)
+
+    return match_fitnesses
+
+def get_uncertain_genomes(genomes:list[tuple[int, neat.DefaultGenome]], match_fitnesses:dict[int, list[float]],
+                          cutoff_ranks:list[int]) -> list[tuple[int, neat.DefaultGenome]]:
+    """
+    Genomes whose mean match fitness is within RACING_Z standard errors of the fitness at any of the cut-off ranks, so that
+    more games could change which side of a selection decision they fall
+    """
+    means = {genome_id: statistics.mean(fitnesses) for genome_id, fitnesses in match_fitnesses.items()}
+    ranked_means = sorted(means.values(), reverse=True)
+    cutoffs = [ranked_means[min(rank, len(ranked_means)) - 1] for rank in cutoff_ranks]
+
+    # Genomes with a single match so far get the spread of all match fitnesses, which overstates their uncertainty
+    all_fitnesses = [fitness for fitnesses in match_fitnesses.values() for fitness in fitnesses]
+    pooled_std = statistics.stdev(all_fitnesses) if len(all_fitnesses) > 1 else 0
+
+    uncertain = []
+    for genome_id, genome in genomes:
+        fitnesses = match_fitnesses.get(genome_id)
+        if fitnesses is None:
+            # Never got a match
+            uncertain.append((genome_id, genome))
+            continue
+
+        std = statistics.stdev(fitnesses) if len(fitnesses) > 1 else pooled_std
+        std_error = std / math.sqrt(len(fitnesses))
+        if any(abs(means[genome_id] - cutoff) <= RACING_Z * std_error for cutoff in cutoffs):
+            uncertain.append((genome_id, genome))
+
+    return uncertain
+
+def race_genomes(genomes:list[tuple[int, neat.DefaultGenome]], config:neat.Config, pool) -> list[MatchResult]:
+    """
+    Play RACING_INITIAL_MATCHES matches for every genome, then keep playing extra matches between the genomes whose rank
+    is uncertain around the elitism and survival cut-offs, until none are or the game budget is spent
+    """
+    game_budget = GAME_BUDGET_PER_GENERATION
+    if game_budget is None:
+        # The same number of games as the fixed schedule
+        game_budget = len(genomes) * NUM_GAMES_PER_GENOME * NUM_GAMES_PER_MATCH // NUM_PLAYERS
+
+    # Cut-offs are for the whole population, as species aren't known here
+    reproduction_config = config.reproduction_config
+    cutoff_ranks = sorted(set([max(1, reproduction_config.elitism),
+                               max(1, math.ceil(reproduction_config.survival_threshold * len(genomes)))]))
+
+    genome_groups = generate_stochastic_groups(genomes, RACING_INITIAL_MATCHES, NUM_PLAYERS)
+    print(f"Racing {len(genomes)} genomes with a budget of {game_budget} games. Playing {len(genome_groups)} initial matches; {RACING_INITIAL_MATCHES} each.")
+
+    results = play_matches(genome_groups, config, pool)
+    num_games = sum(result.num_games for result in results)
+
+    round_number = 1
+    while num_games + NUM_GAMES_PER_MATCH <= game_budget:
+        uncertain = get_uncertain_genomes(genomes, get_match_fitnesses(results), cutoff_ranks)
+        if len(uncertain) < NUM_PLAYERS:
+            break
+
+        # One more match each, without overrunning the budget
+        max_matches = (game_budget - num_games) // NUM_GAMES_PER_MATCH
+        genome_groups = generate_stochastic_groups(uncertain, 1, NUM_PLAYERS)[:max_matches]
+        print(f"Racing round {round_number}: {len(uncertain)} genomes near a cut-off; playing {len(genome_groups)} more matches.")
+
+        round_results = play_matches(genome_groups, config, pool)
+        results += round_results
+        num_games += sum(result.num_games for result in round_results)
+        round_number += 1
+
+    return results
+
+
+def eval_genomes(genomes:list[tuple[int,neat.DefaultGenome]], config:neat.Config, coordinator=None):
     start_time = time.time()
-    with Pool(NUM_WORKERS) as pool:
-        results = list(tqdm(pool.imap(play_match_partial, genome_groups), total=len(genome_groups)))
+
+    population = None
+    if coordinator is None and SHARED_POPULATION:
+        population = SharedPopulation.create(genomes, config)
+
+    # The shared population's memory block outlives this process unless it's unlinked, so release it even if a match raises
+    try:
+        if not coordinator is None:
+            pool = nullcontext(coordinator)
+        elif not population is None:
+            pool = Pool(NUM_WORKERS, initializer=attach_population, initargs=(population.name,))
+        else:
+            pool = Pool(NUM_WORKERS)
+
+        with pool as pool:
+            if RACING:
+                results = race_genomes(genomes, config, pool)
+            else:
+                # Get game pairings
+                genome_groups = generate_stochastic_groups(genomes, NUM_GAMES_PER_GENOME, NUM_PLAYERS)
+
+                # Evaluate pairs using multiprocessing pool
+                print(f"Playing {len(genome_groups)} matches between {len(genomes)} genomes; {NUM_GAMES_PER_GENOME} matches each. {NUM_GAMES_PER_MATCH} games per match.")
+                results = play_matches(genome_groups, config, pool)
+    finally:
+        if not population is None:
+            population.close()
+
     time_diff = time.time() - start_time
 
-    # Reset fitness scores -- TODO is this necessary?
-    for id, genome in genomes:
-        genome.fitness = 0
+    # Tell genomes their fitness. Genomes may have played different numbers of matches, so use their mean match fitness,
+    # scaled to NUM_GAMES_PER_GENOME matches. Genomes which played no matches get the worst match fitness on the same
+    # scale, so they can't rank above any genome which did play.
+    match_fitnesses = get_match_fitnesses(results)
+    worst_fitness = min(map(min, match_fitnesses.values())) * NUM_GAMES_PER_GENOME
+    for genome_id, genome in genomes:
+        fitnesses = match_fitnesses.get(genome_id)
+        genome.fitness = statistics.mean(fitnesses) * NUM_GAMES_PER_GENOME if fitnesses else worst_fitness
 
-    # Tell genomes their fitness
-    for result in results:
-        for id, fitness in result[0].items():
-            for genome_id, genome in genomes:
-                if genome_id == id:
-                    genome.fitness += fitness
-        
     # Print diagnostics
-    print(f"\nNum matches: {len(genome_groups)}",
+    num_games = sum(result.num_games for result in results)
+    num_turns = sum(result.num_turns for result in results)
+    print(f"\nNum matches: {len(results)}",
           f"Time: {time_diff:.2f} s",
-          f"Av game length: {sum([result[1] for result in results]) / len(genome_groups) / NUM_GAMES_PER_MATCH :.1f} turns",
-          f"Time per turn: {time_diff / sum([result[1] for result in results]) * 1e6 :.1f} µs",
+          f"Games played: {num_games} / {len(results) * NUM_GAMES_PER_MATCH}",
+          f"Av game length: {num_turns / num_games :.1f} turns",
+          f"Time per turn: {time_diff / num_turns * 1e6 :.1f} µs",
           sep=" --- ",
           end="\n\n")
 
+    if PROFILE:
+        # Merge the timings from every match
+        profiler = profiling.Profiler()
+        for result in results:
+            profiler.merge(result.profile)
+
+        print(profiler.summary(), end="\n\n")
+        profiler.save_json(os.path.join(PROFILE_FOLDER, "profile.json"))
+        profiler.save_collapsed(os.path.join(PROFILE_FOLDER, "profile.collapsed"))
+
 
     # for i in range(len(genomes)):
     #     for j in range(i + 1, len(genomes)):
@@ -150,15 +432,16 @@ def eval_genomes(genomes:list[tuple[int,neat.DefaultGenome]], config:neat.Config
     #         print(f"{i} vs {j} fitnesses: score: {-game.scores[0]}, {-game.scores[1]} length: {-PENALTY_PER_TURN * num_turns:.2f}")
 
                   
-def run(winner_file:str=ginny.GENOME_FILE_NAME, config_file:str=ginny.CONFIG_FILE_NAME, resume_training:bool=False):
+def run(winner_file:str=ginny.GENOME_FILE_NAME, config_file:str=ginny.CONFIG_FILE_NAME, resume_training:bool=False, coordinator=None):
     # Load configuration
     config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
                          neat.DefaultSpeciesSet, neat.DefaultStagnation,
                          config_file)
     
     # Create the overarching population object
+    checkpoint_store = checkpoints.CheckpointStore(CHECKPOINT_FOLDER, CHECKPOINT_SNAPSHOT_INTERVAL, MAX_CHECKPOINT_SNAPSHOTS)
     if resume_training:
-        p = neat.Checkpointer.restore_checkpoint(os.path.join(CHECKPOINT_FOLDER, os.listdir(CHECKPOINT_FOLDER)[-1]))
+        p = checkpoint_store.restore()
     else:
         p = neat.Population(config)
 
@@ -169,10 +452,11 @@ def run(winner_file:str=ginny.GENOME_FILE_NAME, config_file:str=ginny.CONFIG_FIL
     stats = neat.StatisticsReporter()
     p.add_reporter(stats)
     p.add_reporter(neat_utils.StatsGraphReporter(stats))
-    p.add_reporter(neat.Checkpointer(1, filename_prefix=CHECKPOINT_FOLDER))
+    p.add_reporter(checkpoint_store)
 
     # Train the network
-    winner = p.run(eval_genomes, 10000)
+    # Matches are played by a local process pool, unless a distributed.Coordinator is given
+    winner = p.run(partial(eval_genomes, coordinator=coordinator), 10000)
     
     # Save best genome
     with gzip.open(winner_file, "w") as f:
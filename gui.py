@@ -6,7 +6,9 @@ import time
 import math
 import copy
 import random
-from ginny import Ginny
+import functools
+import game_log
+import agents
 import threading
 
 
@@ -17,7 +19,10 @@ pygame.init()
 # Variables
 NUM_PLAYERS = 2
 NUM_HUMAN_PLAYERS = 1
+OPPONENT = "ginny" # Registered agent playing the computer seats; see agents.AGENTS
+COMPUTER_MOVE_DELAY = 1 # secs between the computer's moves, so they can be followed
 NUM_CARDS_PER_PLAYER = rummy.NUM_CARDS[NUM_PLAYERS]
+GAME_LOG_FILE : str | None = "gui_games.rlog" # Every game played is recorded here; set to None to disable
 
 # Constants
 CARD_WIDTH, CARD_HEIGHT = 50, 75
@@ -58,6 +63,7 @@ CARD_FONT = pygame.font.Font("arial.ttf", size=30)
 BUTTON_FONT = pygame.font.Font("arial.ttf", size=30)
 INFO_FONT = pygame.font.Font("arial.ttf", size=INFO_FONT_SIZE)
 SCORE_FONT = pygame.font.Font(None, size=30)
+BUTTON_TEXT_CACHE_SIZE = 256
 
 # Info variables
 INFO_ON_TIME = 1 # secs
@@ -66,8 +72,46 @@ info_text : str = ""
 info_time : float = 0.0
 
 
+# Pre-rendered card surfaces; font rasterisation is the most expensive part of a frame, so every card face is rendered once here and blitted in Card.draw
+CARD_GLYPHS : dict[str, list[pygame.Surface]] = {} # Card name -> text surface at each integer pixel width (index), for flip animations
+CARD_FACE_SURFACES : dict[str, pygame.Surface] = {}
+CARD_SELECTED_SURFACES : dict[str, pygame.Surface] = {}
+CARD_BACK_SURFACE : pygame.Surface = pygame.Surface((CARD_WIDTH, CARD_HEIGHT), pygame.SRCALPHA)
+
+
+def render_card_surface(card_color:tuple[int], glyph:pygame.Surface|None=None) -> pygame.Surface:
+    surface = pygame.Surface((CARD_WIDTH, CARD_HEIGHT), pygame.SRCALPHA)
+    rect = surface.get_rect()
+
+    pygame.draw.rect(surface, card_color, rect, border_radius=CARD_CORNER_RADIUS)
+    pygame.draw.rect(surface, BLACK, rect, CARD_BORDER_THICKNESS, border_radius=CARD_CORNER_RADIUS)
+
+    if not glyph is None:
+        surface.blit(glyph, glyph.get_rect(center=rect.center))
+
+    return surface.convert_alpha()
+
+def build_card_atlas() -> None:
+    global CARD_BACK_SURFACE
+
+    for card_name in rummy.DECK:
+        glyph = CARD_FONT.render(card_name, True, BLACK if card_name[1] in "♣♠" else RED).convert_alpha()
+
+        CARD_GLYPHS[card_name] = [None] + [pygame.transform.scale(glyph, (width, glyph.get_height())) for width in range(1, glyph.get_width() + 1)]
+        CARD_FACE_SURFACES[card_name] = render_card_surface(WHITE, glyph)
+        CARD_SELECTED_SURFACES[card_name] = render_card_surface(LIGHT_GREEN, glyph)
+
+    CARD_BACK_SURFACE = render_card_surface(RED)
+
+build_card_atlas()
+
+@functools.lru_cache(maxsize=BUTTON_TEXT_CACHE_SIZE)
+def render_button_text(text:str, color:tuple[int]) -> pygame.Surface:
+    return BUTTON_FONT.render(text, True, color)
+
+
 class GUIState:
-    def __init__(self, game:rummy.Game, num_human_players:int|None=None, open_hand:bool=False) -> None:
+    def __init__(self, game:rummy.Game, num_human_players:int|None=None, open_hand:bool=False, opponent:str=OPPONENT) -> None:
         if num_human_players is None:
             num_human_players = game.num_players
         # Assert that 0 <= num_human_players <= num_players
@@ -96,28 +140,27 @@ class GUIState:
         # Start game
         # self.start_new_game(game)
 
+        # Players who can see their cards
+        self.players_at_table = []
+
         # Create cards
         self.cards : Cards = Cards(game, self)
 
         # Assign which players are human
-        self.players_at_table = [] # Players who can see their cards
         self.human_players = [True] * num_human_players + [False] * (game.num_players-num_human_players)
         random.shuffle(self.human_players)
 
-        # Create instances of Ginny
-        genome = Ginny.get_genome()
-        config = Ginny.get_config()
-
-        self.ginnys : list[Ginny | None] = []
+        # Create the computer players
+        self.agents : list[agents.Agent | None] = []
         
         for i in range(game.num_players):
             if self.human_players[i]:
-                self.ginnys.append(None)
+                self.agents.append(None)
             else:
-                self.ginnys.append(Ginny(game, i, genome, config))
+                self.agents.append(agents.make_agent(opponent, game, i, human_delay=COMPUTER_MOVE_DELAY))
 
-        # Create thread for ginnys to run in
-        self.ginny_thread = threading.Thread()
+        # Create thread for the computer players to run in
+        self.agent_thread = threading.Thread()
 
         # Create animator for whose_go bar
         self.player_go_animator = CompoundAnimator({
@@ -162,10 +205,10 @@ class GUIState:
         else:
             self.waiting_for_show_confirmation = False
 
-    def start_ginny_turn(self, game:rummy.Game):
+    def start_agent_turn(self, game:rummy.Game):
         # Get the relevant computer to play their turn
-        self.ginny_thread = threading.Thread(target=self.ginnys[game.whose_go].take_turn)
-        self.ginny_thread.start()
+        self.agent_thread = threading.Thread(target=self.agents[game.whose_go].take_turn)
+        self.agent_thread.start()
 
     def start_new_game(self, game:rummy.Game):
         game.deal()
@@ -174,7 +217,7 @@ class GUIState:
         
         if not self.human_players[game.whose_go]:
             # Get the relevant computer to play their turn
-            self.start_ginny_turn(game)
+            self.start_agent_turn(game)
 
 
     def update(self, game:rummy.Game) -> None:
@@ -186,13 +229,13 @@ class GUIState:
             # Check whether it should wait before flipping cards
             self.check_for_wait(game)
             
-            # Join ginny thread if running
+            # Join the computer player's thread if running
             if not self.human_players[self.player_go_animator.get_target_value("position")] and not game.game_ended:
-                self.ginny_thread.join()
+                self.agent_thread.join()
 
             if not self.human_players[game.whose_go] and not game.game_ended:
                 # Get the relevant computer to play their turn
-                self.start_ginny_turn(game)
+                self.start_agent_turn(game)
                 
             # Move player marker
             self.player_go_animator.start_animation({
@@ -420,17 +463,39 @@ class Cards:
                                               DECK_X, DECK_Y,
                                               face_up=False,
                                               text=card_name) for card_name in game.deck} # Spawn all cards in the deck face down
-        self.priority_draw_cards : list[Card] = []
+        # Cards which need to be drawn last so they appear on top; dict used as an ordered set
+        self.priority_draw_cards : dict[Card, None] = {}
+        self.moving_cards : dict[Card, None] = {}
+        # Everything the layout depends on; cards are only laid out again when this changes
+        self.layout_key : tuple | None = None
         self.update(game, state)
     
     def update(self, game:rummy.Game, state:GUIState):
+        layout_key = (game.version, tuple(state.meld_selected), tuple(state.players_at_table))
+
+        if layout_key != self.layout_key:
+            self.layout_key = layout_key
+            self.layout(game, state)
+
+        # Drop cards which have finished moving, keeping the discard pile on top
+        stopped_cards = [card for card in self.moving_cards if not (card.x.is_animating() or card.y.is_animating())]
+        if stopped_cards:
+            for card in stopped_cards:
+                del self.moving_cards[card]
+            self.update_priority_draw_cards(game)
+
+    def layout(self, game:rummy.Game, state:GUIState):
+        moved_cards : list[Card] = []
+
         # Cards in the deck
         for card_name in game.deck:
-            self.cards[card_name].update(DECK_X, DECK_Y, id="deck", face_up=False)
+            if self.cards[card_name].update(DECK_X, DECK_Y, id="deck", face_up=False):
+                moved_cards.append(self.cards[card_name])
 
         # Cards in the discard pile
         for card_name in game.discard_pile:
-            self.cards[card_name].update(DISCARD_X, DISCARD_Y, id="discard")
+            if self.cards[card_name].update(DISCARD_X, DISCARD_Y, id="discard"):
+                moved_cards.append(self.cards[card_name])
         
         # Cards in melds
         temp_x = MELD_X
@@ -443,7 +508,8 @@ class Cards:
                 temp_x = MELD_X
 
             for card_name in meld:
-                self.cards[card_name].update(temp_x, temp_y, id="meld")
+                if self.cards[card_name].update(temp_x, temp_y, id="meld"):
+                    moved_cards.append(self.cards[card_name])
                 temp_x += CARD_WIDTH
             
             temp_x += MARGIN
@@ -453,24 +519,23 @@ class Cards:
             for j, card_name in enumerate(cards):
                 selected = i == game.whose_go and j in state.meld_selected
 
-                self.cards[card_name].update(
-                    PLAYER_CARDS_X + MARGIN + j * (CARD_WIDTH + MARGIN),
-                    PLAYER_CARDS_Y + MARGIN + i * (CARD_HEIGHT + MARGIN*2),
-                    id=f"card-{i}-{j}",
-                    selected=selected,
-                    face_up = i in state.players_at_table
-                )
+                if self.cards[card_name].update(
+                        PLAYER_CARDS_X + MARGIN + j * (CARD_WIDTH + MARGIN),
+                        PLAYER_CARDS_Y + MARGIN + i * (CARD_HEIGHT + MARGIN*2),
+                        id=f"card-{i}-{j}",
+                        selected=selected,
+                        face_up = i in state.players_at_table):
+                    moved_cards.append(self.cards[card_name])
 
+        # Handle priority cards - the discard pile is drawn on top, in pile order, followed by any moving cards
+        for card in moved_cards:
+            self.moving_cards[card] = None
 
-        # Handle priority cards - cards which need to be drawn last so they appear on top
-        self.priority_draw_cards : list[Card] = []
+        self.update_priority_draw_cards(game)
 
-        # Add discard pile to priority drawing; to be drawn at the end
-        self.priority_draw_cards += [self.cards[card] for card in game.discard_pile]
-
-        for card in self.cards.values():
-            if any([card.x.is_animating(), card.y.is_animating()]):
-                self.priority_draw_cards.append(card)
+    def update_priority_draw_cards(self, game:rummy.Game):
+        self.priority_draw_cards = {self.cards[card]: None for card in game.discard_pile}
+        self.priority_draw_cards.update(self.moving_cards)
 
     def draw(self, surface:pygame.surface.Surface):
         for card in self.cards.values():
@@ -505,14 +570,16 @@ class Card:
             "color": ColorAnimator(LIGHT_GREEN if selected else WHITE, 0.5, animation_type="linear")
         })
     
-    def update(self, x:int|None=None, y:int|None=None, id:str|None=None, face_up:bool=True, selected:bool|None=False):
+    def update(self, x:int|None=None, y:int|None=None, id:str|None=None, face_up:bool=True, selected:bool|None=False) -> bool:
+        """Returns whether the card has started moving to a new position"""
         # Position
         if x is None:
             x = self.x.get_target_value()
         if y is None:
             y = self.y.get_target_value()
 
-        if x != self.x.get_target_value() or y != self.y.get_target_value():
+        moved = x != self.x.get_target_value() or y != self.y.get_target_value()
+        if moved:
             self.x.start_animation(x)
             self.y.start_animation(y)
 
@@ -533,8 +600,25 @@ class Card:
                 "color": LIGHT_GREEN if selected else WHITE
             })
 
+        return moved
+
     def draw(self, surface:pygame.surface.Surface) -> pygame.Rect:
         """Draw a card with rounded corners and text."""
+        # Static cards are blitted straight from the pre-rendered atlas
+        if not self.face_up.is_animating() and not self.selected.is_animating():
+            self.rect = pygame.Rect(self.x.get_current_value(), self.y.get_current_value(), self.width, self.height)
+
+            if not self.face_up.get_current_value("boolean"):
+                card_surface = CARD_BACK_SURFACE
+            elif self.selected.get_current_value("boolean"):
+                card_surface = CARD_SELECTED_SURFACES[self.text]
+            else:
+                card_surface = CARD_FACE_SURFACES[self.text]
+
+            surface.blit(card_surface, self.rect)
+
+            return self.rect
+
         self.rect = pygame.Rect(
             self.x.get_current_value() + (self.width//2 - abs(self.face_up.get_current_value("abs_width")//2)),
             self.y.get_current_value(),
@@ -556,11 +640,16 @@ class Card:
         pygame.draw.rect(surface, card_color, self.rect, border_radius=CARD_CORNER_RADIUS)
         pygame.draw.rect(surface, border_color, self.rect, CARD_BORDER_THICKNESS, border_radius=CARD_CORNER_RADIUS)
         
-        # Draw the text
-        text_surface = CARD_FONT.render(self.text if self.face_up.get_current_value("abs_width") > 0 else "", True, BLACK if self.text[1] in "♣♠" else RED)
-        text_surface = pygame.transform.scale(text_surface, (text_surface.get_width() * max(0, self.face_up.get_current_value("text_width")), text_surface.get_height()))
-        text_rect = text_surface.get_rect(center=self.rect.center)
-        surface.blit(text_surface, text_rect)
+        # Draw the text, using the pre-scaled glyph for the current flip width
+        if self.face_up.get_current_value("abs_width") > 0:
+            glyphs = CARD_GLYPHS[self.text]
+            text_surface = glyphs[int((len(glyphs) - 1) * pygame.math.clamp(self.face_up.get_current_value("text_width"), 0, 1))]
+
+            if not text_surface is None:
+                text_rect = text_surface.get_rect(center=self.rect.center)
+                surface.blit(text_surface, text_rect)
+
+        return self.rect
 
 
 class Button:
@@ -643,7 +732,7 @@ class Button:
         pygame.draw.rect(surface, self.enabled.get_current_value("background_color"), self.rect, border_radius=CARD_CORNER_RADIUS)
         
         # Draw the text
-        text_surface = BUTTON_FONT.render(self.text.get_current_value("text"), True, text_color)
+        text_surface = render_button_text(self.text.get_current_value("text"), tuple(int(value) for value in text_color))
         text_rect = text_surface.get_rect(center=self.rect.center)
         surface.blit(text_surface, text_rect)
 
@@ -720,7 +809,7 @@ def on_mouse_click(position:tuple, game:rummy.Game, state:GUIState) -> None:
             elif button.id == "confirm_meld":
                 try:
                     game.lay_meld(game.whose_go, state.meld_selected)
-                except (AssertionError, rummy.BadMeldError) as e:
+                except rummy.IllegalMoveError as e:
                     show_info(e)
                 
                 state.change_meld_mode(False)
@@ -734,12 +823,12 @@ def on_mouse_click(position:tuple, game:rummy.Game, state:GUIState) -> None:
                 if card.id == "deck":
                     try:
                         game.draw(player=game.whose_go, from_deck=True)
-                    except AssertionError as e:
+                    except rummy.IllegalMoveError as e:
                         show_info(e)
                 elif card.id == "discard":
                     try:
                         game.draw(player=game.whose_go, from_deck=False)
-                    except AssertionError as e:
+                    except rummy.IllegalMoveError as e:
                         show_info(e)
                 elif card.id[:4] == "card":
                     # Parse player and card index
@@ -752,7 +841,7 @@ def on_mouse_click(position:tuple, game:rummy.Game, state:GUIState) -> None:
                         
                         if game.game_ended:
                             show_info("Game has ended; click anywhere to shuffle")
-                    except AssertionError as e:
+                    except rummy.IllegalMoveError as e:
                         show_info(e)
             
             else:
@@ -779,6 +868,9 @@ def main() -> None:
     # Initialise game
     game = rummy.Game(NUM_PLAYERS)
 
+    if not GAME_LOG_FILE is None:
+        recorder = game_log.GameRecorder(game, GAME_LOG_FILE)
+
     game.shuffle()
 
     # Initialise GUI state
@@ -840,6 +932,9 @@ def main() -> None:
         pygame.display.flip()
         clock.tick(60)
 
+    if not GAME_LOG_FILE is None:
+        recorder.close()
+
     pygame.quit()
     sys.exit()
 
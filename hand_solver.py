@@ -0,0 +1,151 @@
+"""
+Finds the minimum-deadwood way to split a hand into melds, extensions onto melds already on the table, and deadwood.
+
+Cards are handled as bitmasks (bit i is rummy.DECK[i]), and every possible meld is precomputed at import, so the search is a
+memoised dynamic programme over sub-masks of the hand. Rearranging melds on the table isn't considered.
+"""
+import rummy
+from dataclasses import dataclass, field
+
+
+CARD_BITS : dict[str, int] = rummy.CARD_BITS
+CARD_SCORES_BY_INDEX : list[int] = [rummy.Game.get_score([card]) for card in rummy.DECK]
+MAX_CACHED_TABLES = 64
+
+
+def get_mask(cards:list[str]) -> int:
+    mask = 0
+    for card in cards:
+        mask |= CARD_BITS[card]
+    return mask
+
+def get_cards(mask:int) -> list[str]:
+    return [card for card in rummy.DECK if mask & CARD_BITS[card]]
+
+def _get_run_cards(suit:str, start:int, length:int) -> list[str]:
+    return [rummy.DOUBLED_NUMBERS[start + i] + suit for i in range(length)]
+
+# Every valid meld, and the melds containing each card
+ALL_MELDS : list[int] = rummy.MELD_MASKS
+MELDS_BY_CARD : list[list[int]] = [[meld for meld in ALL_MELDS if meld >> i & 1] for i in range(len(rummy.DECK))]
+
+
+@dataclass
+class HandPartition:
+    deadwood : int
+    melds : list[list[str]] = field(default_factory=list)
+    # (index of the meld on the table, cards to add to it)
+    extensions : list[tuple[int, list[str]]] = field(default_factory=list)
+    deadwood_cards : list[str] = field(default_factory=list)
+
+
+def get_extensions(melds:list[list[str]], meld_types:list[str]) -> list[tuple[int, int]]:
+    """
+    Every group of cards which could be laid onto a meld on the table, as (meld index, mask).
+    For runs, groups extend one end; a group on each end can be laid together.
+    """
+    extensions : list[tuple[int, int]] = []
+
+    for meld_index, (meld, meld_type) in enumerate(zip(melds, meld_types)):
+        if meld_type == "set":
+            if len(meld) < len(rummy.SUITS):
+                extensions.append((meld_index, get_mask([meld[0][0] + suit for suit in rummy.SUITS]) & ~get_mask(meld)))
+            continue
+
+        # Find the first card of the run, allowing for runs which wrap round
+        numbers = set(card[0] for card in meld)
+        suit = meld[0][1]
+        start = next(i for i in range(len(rummy.NUMBERS)) if rummy.NUMBERS[i] in numbers and not rummy.NUMBERS[i-1] in numbers) \
+            if len(numbers) < len(rummy.NUMBERS) else 0
+        space = len(rummy.NUMBERS) - len(meld)
+
+        for length in range(1, space + 1):
+            # Right hand end
+            extensions.append((meld_index, get_mask(_get_run_cards(suit, (start + len(meld)) % len(rummy.NUMBERS), length))))
+            # Left hand end
+            extensions.append((meld_index, get_mask(_get_run_cards(suit, (start - length) % len(rummy.NUMBERS), length))))
+
+    return extensions
+
+
+# Memo of best deadwood per hand mask, for each table; shared across calls as agents solve similar hands every turn
+_table_memos : dict[tuple, dict[int, tuple[int, int, int]]] = {}
+
+
+def _get_memo(table_key:tuple) -> dict[int, tuple[int, int, int]]:
+    memo = _table_memos.get(table_key)
+
+    if memo is None:
+        if len(_table_memos) >= MAX_CACHED_TABLES:
+            # Drop the oldest table
+            del _table_memos[next(iter(_table_memos))]
+        memo = _table_memos[table_key] = {0: (0, 0, -1)}
+
+    return memo
+
+def _solve(mask:int, candidates:list[list[tuple[int, int]]], memo:dict[int, tuple[int, int, int]]) -> int:
+    """
+    Min deadwood of the cards in mask. memo maps mask -> (deadwood, chosen meld mask (0 if the lowest card is deadwood), table meld index or -1)
+    """
+    result = memo.get(mask)
+    if not result is None:
+        return result[0]
+
+    lowest_bit = mask & -mask
+    card_index = lowest_bit.bit_length() - 1
+
+    # Either the lowest card is deadwood...
+    best = (CARD_SCORES_BY_INDEX[card_index] + _solve(mask ^ lowest_bit, candidates, memo), 0, -1)
+
+    # ...or it's part of a meld or extension
+    for meld, table_index in candidates[card_index]:
+        if meld & mask == meld:
+            deadwood = _solve(mask ^ meld, candidates, memo)
+            if deadwood < best[0]:
+                best = (deadwood, meld, table_index)
+                if deadwood == 0:
+                    break
+
+    memo[mask] = best
+    return best[0]
+
+
+def solve_hand(hand:list[str], melds:list[list[str]]|None=None, meld_types:list[str]|None=None) -> HandPartition:
+    if melds is None:
+        melds = []
+    if meld_types is None:
+        meld_types = [rummy.Game.is_valid_meld(meld)[1] for meld in melds]
+
+    hand_mask = get_mask(hand)
+    extensions = get_extensions(melds, meld_types)
+
+    # Only keep melds and extensions which can be made from the hand, grouped by the cards they contain
+    candidates : list[list[tuple[int, int]]] = [[] for _ in rummy.DECK]
+    for i, card in enumerate(rummy.DECK):
+        if hand_mask >> i & 1:
+            candidates[i] = [(meld, -1) for meld in MELDS_BY_CARD[i] if meld & hand_mask == meld]
+            candidates[i] += [(mask, table_index) for table_index, mask in extensions if mask >> i & 1 and mask & hand_mask == mask]
+
+    memo = _get_memo(tuple(get_mask(meld) for meld in melds))
+    deadwood = _solve(hand_mask, candidates, memo)
+
+    # Walk back through the memo to recover the partition
+    partition = HandPartition(deadwood)
+    mask = hand_mask
+    while mask:
+        _, meld, table_index = memo[mask]
+        if meld == 0:
+            lowest_bit = mask & -mask
+            partition.deadwood_cards.append(rummy.DECK[lowest_bit.bit_length() - 1])
+            mask ^= lowest_bit
+        else:
+            if table_index == -1:
+                partition.melds.append(rummy.Game.sort_cards(get_cards(meld), is_meld=True))
+            else:
+                partition.extensions.append((table_index, get_cards(meld)))
+            mask ^= meld
+
+    return partition
+
+def solve_player(game:rummy.Game, player:int) -> HandPartition:
+    return solve_hand(game.get_hand(player), game.melds, game.meld_types)
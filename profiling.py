@@ -0,0 +1,114 @@
+"""
+Opt-in per-phase timings and counters for the engine and Ginny.
+
+Instrumented code reads the module-level `profiler`, which is None unless profiling has been enabled, so the cost when
+disabled is a single attribute lookup and comparison per phase:
+
+    profiler = profiling.profiler
+    if profiler is not None:
+        profiler.start("meld search")
+    ...
+    if profiler is not None:
+        profiler.stop()
+
+Phases nest, and are recorded by their full path (eg "take_turn;meld search;knowledge updates").
+"""
+import json
+import time
+
+
+class Profiler:
+    def __init__(self) -> None:
+        # Currently open phases: [path, start time, time spent in child phases]
+        self.stack : list[list] = []
+        # Path -> [count, total secs, self secs (excluding child phases)]
+        self.timings : dict[str, list[float]] = {}
+        self.counters : dict[str, int] = {}
+
+    def start(self, name:str) -> None:
+        path = f"{self.stack[-1][0]};{name}" if self.stack else name
+        self.stack.append([path, time.perf_counter(), 0.0])
+
+    def stop(self) -> None:
+        path, start_time, child_time = self.stack.pop()
+        elapsed = time.perf_counter() - start_time
+
+        timing = self.timings.get(path)
+        if timing is None:
+            timing = self.timings[path] = [0, 0.0, 0.0]
+        timing[0] += 1
+        timing[1] += elapsed
+        timing[2] += elapsed - child_time
+
+        if self.stack:
+            self.stack[-1][2] += elapsed
+
+    def count(self, name:str, amount:int=1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self) -> None:
+        self.stack = []
+        self.timings = {}
+        self.counters = {}
+
+    def to_dict(self) -> dict:
+        return {
+            "timings": {path: {"count": count, "total_s": total, "self_s": self_time} for path, (count, total, self_time) in self.timings.items()},
+            "counters": dict(self.counters)
+        }
+
+    def merge(self, data:dict) -> None:
+        """
+        Add in results from another profiler, as produced by to_dict (eg sent back from a worker process)
+        """
+        for path, timing in data["timings"].items():
+            own_timing = self.timings.get(path)
+            if own_timing is None:
+                own_timing = self.timings[path] = [0, 0.0, 0.0]
+            own_timing[0] += timing["count"]
+            own_timing[1] += timing["total_s"]
+            own_timing[2] += timing["self_s"]
+
+        for name, amount in data["counters"].items():
+            self.count(name, amount)
+
+    def save_json(self, file_name:str) -> None:
+        with open(file_name, "w") as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+    def save_collapsed(self, file_name:str) -> None:
+        """
+        Save self times in collapsed-stack format ("a;b;c <µs>" per line), as read by flamegraph.pl and speedscope
+        """
+        with open(file_name, "w") as f:
+            for path, (_, _, self_time) in sorted(self.timings.items()):
+                f.write(f"{path} {round(self_time * 1e6)}\n")
+
+    def summary(self, num_phases:int=10) -> str:
+        total_time = sum(self_time for _, _, self_time in self.timings.values())
+        lines = [f"{'Phase':<60} {'Calls':>10} {'Self time':>10} {'Share':>7}"]
+
+        for path, (count, _, self_time) in sorted(self.timings.items(), key=lambda item: -item[1][2])[:num_phases]:
+            lines.append(f"{path:<60} {count:>10} {self_time:>9.2f}s {self_time / total_time if total_time else 0:>7.1%}")
+
+        for name, amount in sorted(self.counters.items()):
+            lines.append(f"{name}: {amount}")
+
+        return "\n".join(lines)
+
+
+profiler : Profiler | None = None
+
+
+def enable() -> Profiler:
+    global profiler
+
+    if profiler is None:
+        profiler = Profiler()
+
+    return profiler
+
+def disable() -> None:
+    global profiler
+
+    profiler = None
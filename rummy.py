@@ -1,6 +1,9 @@
 import random
-import copy
+import warnings
+import profiling
 from dataclasses import dataclass, field
+from collections.abc import Sequence
+from typing import Callable
 
 
 NUMBERS : str = "A234567890JQK"
@@ -8,6 +11,9 @@ DOUBLED_NUMBERS : str = NUMBERS + NUMBERS
 CARD_SCORES : list[int] = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10]
 SUITS : str = "♣♦♥♠"
 DECK : list[str] = [f"{i}{j}" for j in SUITS for i in NUMBERS]
+CARD_INDICES : dict[str, int] = {card: i for i, card in enumerate(DECK)}
+CARD_RANKS : dict[str, int] = {card: NUMBERS.index(card[0]) for card in DECK}
+BACKENDS : tuple[str, ...] = ("python", "numba")
 NUM_CARDS : dict[int, int] = {
     2 : 10,
     3 : 7,
@@ -17,6 +23,83 @@ NUM_CARDS : dict[int, int] = {
 }
 
 
+# --- Precomputed sort keys ---
+def _get_run_start(rank_mask:int) -> int:
+    # The first rank present whose predecessor isn't, so runs wrapping round (eg KA2) start in the right place.
+    # Ranks from 2 upwards are checked before A, and if there's no such rank the order starts at A
+    for rank in list(range(1, len(NUMBERS))) + [0]:
+        if rank_mask >> rank & 1 and not rank_mask >> ((rank - 1) % len(NUMBERS)) & 1:
+            return rank
+    return 0
+
+# Sort key for each card, by number then suit
+CARD_SORT_KEYS : dict[str, int] = {card: CARD_RANKS[card] * len(SUITS) + SUITS.index(card[1]) for card in DECK}
+# Sort keys for melds, for each rank the meld may start at
+MELD_SORT_KEYS : list[dict[str, int]] = [
+    {card: (CARD_RANKS[card] - start) % len(NUMBERS) * len(SUITS) + SUITS.index(card[1]) for card in DECK}
+    for start in range(len(NUMBERS))]
+# Starting rank of a meld, indexed by the bitmask of the ranks in it
+RUN_STARTS : list[int] = [_get_run_start(rank_mask) for rank_mask in range(1 << len(NUMBERS))]
+
+
+# --- Precomputed melds ---
+# Cards as bitmasks, where bit i is DECK[i]
+CARD_BITS : dict[str, int] = {card: 1 << i for i, card in enumerate(DECK)}
+
+def _build_meld_masks() -> list[int]:
+    melds : set[int] = set()
+
+    # Sets of 3 and 4
+    for number in NUMBERS:
+        same_number = sum(CARD_BITS[number + suit] for suit in SUITS)
+        melds.add(same_number)
+        for suit in SUITS:
+            melds.add(same_number & ~CARD_BITS[number + suit])
+
+    # Runs, including those wrapping round from K to A
+    for suit in SUITS:
+        for start in range(len(NUMBERS)):
+            for length in range(3, len(NUMBERS) + 1):
+                melds.add(sum(CARD_BITS[DOUBLED_NUMBERS[start + i] + suit] for i in range(length)))
+
+    return sorted(melds)
+
+# Every valid meld as a bitmask, and the melds whose lowest card is each card
+MELD_MASKS : list[int] = _build_meld_masks()
+MELDS_BY_LOWEST_CARD : list[list[int]] = [[meld for meld in MELD_MASKS if meld & -meld == 1 << i] for i in range(len(DECK))]
+# 3-card melds containing each card, as rearranging the table always makes one of these
+THREE_CARD_MELDS_BY_CARD : list[list[int]] = [[meld for meld in MELD_MASKS if meld >> i & 1 and meld.bit_count() == 3] for i in range(len(DECK))]
+
+
+# --- Card neighbours, shared by Game's partial meld search and agents' card features ---
+def _get_rank_offset_card(card:str, offset:int) -> str:
+    # Ranks wrap round, so K and A are neighbours
+    return NUMBERS[(CARD_RANKS[card] + offset) % len(NUMBERS)] + card[1]
+
+def _build_meld_friends(card:str) -> dict[str, tuple[str, ...]]:
+    friends : dict[str, tuple[str, ...]] = {}
+
+    # Runs
+    friends[_get_rank_offset_card(card, -2)] = (_get_rank_offset_card(card, -1),)
+    friends[_get_rank_offset_card(card, -1)] = (_get_rank_offset_card(card, -2), _get_rank_offset_card(card, 1))
+    friends[_get_rank_offset_card(card, 1)] = (_get_rank_offset_card(card, -1), _get_rank_offset_card(card, 2))
+    friends[_get_rank_offset_card(card, 2)] = (_get_rank_offset_card(card, 1),)
+
+    # Sets
+    for suit in SUITS:
+        if suit != card[1]:
+            friends[card[0] + suit] = tuple(card[0] + suit_2 for suit_2 in SUITS if suit_2 != card[1] and suit_2 != suit)
+
+    return friends
+
+# The cards one and two ranks below and above each card in its suit, and the cards of the same rank in the other suits
+RUN_NEIGHBOURS_1 : dict[str, tuple[str, str]] = {card: (_get_rank_offset_card(card, -1), _get_rank_offset_card(card, 1)) for card in DECK}
+RUN_NEIGHBOURS_2 : dict[str, tuple[str, str]] = {card: (_get_rank_offset_card(card, -2), _get_rank_offset_card(card, 2)) for card in DECK}
+SAME_RANK_CARDS : dict[str, tuple[str, ...]] = {card: tuple(card[0] + suit for suit in SUITS if suit != card[1]) for card in DECK}
+# For each card, every card which could go in a 3-card meld with it, and the cards which would complete that meld
+MELD_FRIENDS : dict[str, dict[str, tuple[str, ...]]] = {card: _build_meld_friends(card) for card in DECK}
+
+
 @dataclass
 class CardKnowledge:
     # Number of possible melds which this card facilitates
@@ -26,33 +109,216 @@ class CardKnowledge:
     # Number of cards this allows the player to meld immediately
     num_immediate_meld_cards : int = 0
 
+class UnseenCards:
+    '''
+    A player's view of the cards they haven't seen, in the order they'd have been listed in.
+    All players share one ordered collection of cards whose location isn't public (the game's unseen cards); each player's
+    view just hides the cards they've seen privately (their dealt hand, and cards they've drawn from the deck), so no
+    per-player copies are needed.
+    Read-only; the game updates the shared cards and the player's seen cards (Knowledge.seen_cards) directly.
+    '''
+    __slots__ = ("_unseen", "_seen")
+
+    def __init__(self, unseen:dict[str, None], seen:set[str]) -> None:
+        self._unseen = unseen
+        self._seen = seen
+
+    def __iter__(self):
+        seen = self._seen
+        return (card for card in self._unseen if not card in seen)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __contains__(self, card:str) -> bool:
+        return card in self._unseen and not card in self._seen
+
+    def __repr__(self) -> str:
+        return f"UnseenCards({list(self)})"
+
+    def copy(self) -> list[str]:
+        return list(self)
+
+class ReadOnlyList(Sequence):
+    '''
+    A list which can be read but not changed through this reference, without copying it. Changes to the underlying list
+    show through.
+    '''
+    __slots__ = ("_items",)
+
+    def __init__(self, items:list) -> None:
+        self._items = items
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __contains__(self, item) -> bool:
+        return item in self._items
+
+    def index(self, item, *args) -> int:
+        return self._items.index(item, *args)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, ReadOnlyList):
+            other = other._items
+        return self._items == other
+
+    def __repr__(self) -> str:
+        return f"ReadOnlyList({self._items!r})"
+
+    def copy(self) -> list:
+        return self._items.copy()
+
 @dataclass
 class Knowledge:
-    deck : list[str]
+    deck : UnseenCards
+    hands : list[list[str]]
+    partial_melds : list[tuple[tuple[str, str], tuple[str, ...]]] = field(default_factory=list) # [(partial meld, cards which can complete meld)]
+    # Cards this player has seen privately (their dealt hand and cards drawn from the deck), which deck leaves out
+    seen_cards : set[str] = field(default_factory=set)
+    # Probability of each card (rows, as rummy.DECK) being in each player's hand (columns), if a beliefs.BeliefTracker is attached
+    beliefs : "np.ndarray | None" = None
+
+
+# --- Game events, published to listeners registered with Game.add_listener ---
+# DealtEvent.hands and GameEndedEvent.scores are the game's own lists rather than copies; listeners must not mutate them.
+# ReshuffledEvent.deck is a copy, as Game.deck returns one.
+@dataclass
+class GameEvent:
+    pass
+
+@dataclass
+class DealtEvent(GameEvent):
     hands : list[list[str]]
-    partial_melds : list[tuple[list[str]]] = field(default_factory=list) # [(partial meld, cards which can complete meld)]
+    discard_card : str
+    whose_go : int
+
+@dataclass
+class DrewFromDeckEvent(GameEvent):
+    player : int
+    card : str
+
+@dataclass
+class DrewFromDiscardEvent(GameEvent):
+    player : int
+    card : str
+
+@dataclass
+class ReshuffledEvent(GameEvent):
+    deck : list[str]
+
+@dataclass
+class MeldLaidEvent(GameEvent):
+    player : int
+    card_indices : list[int]
+    cards : list[str]
+    meld_index : int
+
+@dataclass
+class MeldExtendedEvent(GameEvent):
+    player : int
+    card_indices : list[int]
+    cards : list[str]
+    meld_index : int
+
+@dataclass
+class MeldRearrangedEvent(GameEvent):
+    player : int
+    card_indices : list[int]
+    cards : list[str]
+    # Cards taken from existing melds, and the (meld index, card index) they were taken from
+    taken_cards : list[str]
+    taken_locations : list[tuple[int]]
+
+@dataclass
+class DiscardedEvent(GameEvent):
+    player : int
+    card_index : int
+    card : str
 
+@dataclass
+class GameEndedEvent(GameEvent):
+    # None if the game was ended before anyone went out
+    winner : int | None
+    scores : list[int]
+
+
+@dataclass(frozen=True)
+class LegalActions:
+    """
+    Every move the current player can make, from Game.get_legal_actions. Frozen, as one is shared by everything reading
+    the game's legal moves until it changes.
+    """
+    draw_from_deck : bool = False
+    draw_from_discard : bool = False
+    # Bit i is set if the card at index i of the hand can be discarded
+    discard_mask : int = 0
+    # Sorted hand indices of every group of cards which lay_meld would accept
+    melds : tuple[tuple[int, ...], ...] = ()
+
+
+class IllegalMoveError(Exception):
+    """
+    A move which breaks the rules, eg playing out of turn. Only checked for in strict mode, apart from BadMeldError.
+    """
+    pass
 
-class BadMeldError(Exception):
+class BadMeldError(IllegalMoveError):
     def __init__(self, message):
         # Call the base class constructor with the parameters it needs
         super().__init__(message)
 
 
 class Game():
-    def __init__(self, num_players:int=2, human_readable:bool=True, allow_rearranging:bool=True) -> None:
-        # Assert that the number of players is valid
-        assert num_players in NUM_CARDS.keys(), f"Invalid number of players, must be one of {list(NUM_CARDS.keys())}"
+    def __init__(self, num_players:int=2, human_readable:bool=True, allow_rearranging:bool=True, strict:bool=True,
+                 backend:str="python", rng:random.Random|None=None) -> None:
+        """
+        In strict mode, every move is checked against the rules and an IllegalMoveError raised if it breaks them. Turning
+        strict mode off skips these checks, for trusted agents which only make legal moves (eg using get_legal_actions).
+        Melds are always checked, as laying them depends on working out which kind of meld they are.
+
+        backend is one of BACKENDS: "numba" swaps in the compiled kernels from rummy_kernels, falling back to "python"
+        (the reference implementation) with a warning if Numba isn't installed.
+
+        rng shuffles the deck and picks who starts; the random module's shared generator is used if none is given.
+        """
+        # Check that the number of players is valid
+        if not num_players in NUM_CARDS.keys():
+            raise ValueError(f"Invalid number of players, must be one of {list(NUM_CARDS.keys())}")
+
+        if not backend in BACKENDS:
+            raise ValueError(f"Invalid backend, must be one of {list(BACKENDS)}")
+
+        if backend == "numba":
+            import rummy_kernels
+            if rummy_kernels.NUMBA_AVAILABLE:
+                rummy_kernels.install(self)
+            else:
+                warnings.warn("Numba isn't installed; using the python backend")
+                backend = "python"
 
         # Assign self values
+        self.backend : str = backend
+        self.rng : random.Random | None = rng
         self.num_players : int = num_players
         self.num_cards : int = NUM_CARDS[num_players]
         self.human_readable : bool = human_readable
         self.allow_rearranging : bool = allow_rearranging
+        self.strict : bool = strict
 
         # Initialise scores
         self.scores : list[int] = [0 for i in range(self.num_players)]
 
+        # The deck is a pre-shuffled list with a cursor; cards before deck_position have been drawn
+        self.deck_cards : list[str] = DECK.copy()
+        self.deck_position : int = 0
+
         # Shuffle the cards in the deck
         self.has_shuffled = False
 
@@ -63,14 +329,45 @@ class Game():
 
         self.game_ended = True
 
+        # Incremented on every change to the game state, so observers can cheaply check whether anything has changed
+        self.version : int = 0
+        # Incremented only when the melds on the table change
+        self.melds_version : int = 0
+
+        # Legal actions for the current game version, and the masks of cards which extend each meld on the table
+        self._legal_actions : LegalActions | None = None
+        self._legal_actions_version : int = -1
+        self._meld_extensions : list[list[int]] = []
+        self._meld_extensions_version : int = -1
+
+        # Functions called with a GameEvent whenever the game state changes
+        self.listeners : list[Callable[[GameEvent], None]] = []
+
+        # Per-player read-only views, made on first use by get_view
+        self._views : list[GameView] = []
+
+
+    def add_listener(self, listener:Callable[[GameEvent], None]) -> None:
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener:Callable[[GameEvent], None]) -> None:
+        self.listeners.remove(listener)
+
+    def _emit(self, event:GameEvent) -> None:
+        # Callers check self.listeners first, so no event is built when nobody is listening
+        for listener in self.listeners:
+            listener(event)
+
 
     def shuffle(self):
         # Make sure game has ended before restarting
-        assert self.game_ended, "Can't restart game now; old game hasn't ended yet"
+        if self.strict and not self.game_ended:
+            raise IllegalMoveError("Can't restart game now; old game hasn't ended yet")
 
-        # Create shuffled deck
-        self.deck : list[str] = DECK.copy()
-        random.shuffle(self.deck)
+        # Create shuffled deck, reusing the deck's list
+        self.deck_cards[:] = DECK
+        self.get_rng().shuffle(self.deck_cards)
+        self.deck_position = 0
 
         self.discard_pile : list[str] = []
         self.hands : list[list[str]] = [[] for _ in range(self.num_players)]
@@ -78,75 +375,101 @@ class Game():
         self.meld_types : list[str] = []
 
         # Randomise which player starts
-        self.whose_go : int = random.randint(0, self.num_players - 1)
+        self.whose_go : int = self.get_rng().randint(0, self.num_players - 1)
 
         self.has_shuffled = True
         self.has_drawn = False
 
+        self.version += 1
+        self.melds_version += 1
+
     def deal(self):
-        # Assert that the deck has been shuffled before dealing
-        assert self.has_shuffled, "Can't deal until you've shuffled"
+        # Check that the deck has been shuffled before dealing
+        if self.strict and not self.has_shuffled:
+            raise IllegalMoveError("Can't deal until you've shuffled")
 
         # Deal the cards
-        self.hands = [self.deck[i*self.num_cards : (i+1)*self.num_cards] for i in range(0, self.num_players)]
-        self.discard_pile = [self.deck[self.num_players * self.num_cards]]
-        self.deck = self.deck[self.num_players * self.num_cards + 1:]
+        self.hands = [self.deck_cards[i*self.num_cards : (i+1)*self.num_cards] for i in range(0, self.num_players)]
+        self.discard_pile = [self.deck_cards[self.num_players * self.num_cards]]
+        self.deck_position = self.num_players * self.num_cards + 1
         
         # Sort the hands for easier legibility
         if self.human_readable:
             self.hands = [self.sort_cards(hand) for hand in self.hands]
 
-        # Initialise players' knowledge of where cards are
-        self.player_knowledges : list[Knowledge] = [Knowledge(
-            DECK.copy(),
-            [[] for _ in range(self.num_players)]
-        ) for _ in range(self.num_players)]
+        profiler = profiling.profiler
+        if profiler is not None:
+            profiler.start("knowledge updates")
 
+        # Initialise players' knowledge of where cards are; every card except the discard is unseen, apart from each player's own hand
+        self.unseen_cards : dict[str, None] = dict.fromkeys(DECK)
+        del self.unseen_cards[self.discard_pile[0]]
+
+        self.player_knowledges : list[Knowledge] = []
         for player in range(self.num_players):
-            # Remove discard card and player's hand from knowledge of the deck
-            self.player_knowledges[player].deck.remove(self.discard_pile[0])
-            for card in self.get_hand(player):
-                self.player_knowledges[player].deck.remove(card)
-            
-            # Copy own cards to own knowledge
-            self.player_knowledges[player].hands[player] = self.get_hand(player).copy()
+            seen_cards = set(self.get_hand(player))
+            self.player_knowledges.append(Knowledge(
+                UnseenCards(self.unseen_cards, seen_cards),
+                [[] for _ in range(self.num_players)],
+                seen_cards=seen_cards
+            ))
+
+        for player in range(self.num_players):
+            # Own knowledge of own hand is the hand itself, so it never needs updating
+            self.player_knowledges[player].hands[player] = self.get_hand(player)
 
             # Initialise knowledge of own hand
             # Find partial melds
             for ind, card in enumerate(self.get_hand(player)):
                 self.update_partial_melds(player, self.get_hand(player)[ind+1:], card)
 
+        if profiler is not None:
+            profiler.stop()
+
         # Play has just started
         self.has_shuffled = False
         self.game_ended = False
         self.num_turns_taken = 0
 
+        self.version += 1
+
+        if self.listeners:
+            self._emit(DealtEvent(self.hands, self.discard_pile[0], self.whose_go))
+
 
     def draw(self, player:int, from_deck:bool=True) -> None:
-        # Assert that the game hasn't ended
-        assert not self.game_ended, "The game has ended; player cannot draw another card"
-        # Assert that the correct player is playing
-        assert player == self.whose_go, f"Player {player} can't draw a card because it's currently player {self.whose_go}'s turn"
-        # Assert that the player hasn't drawn a card yet
-        assert not self.has_drawn, "Player has already drawn a card this turn"
+        if self.strict:
+            self._check_turn(player, "draw a card")
+            # Check that the player hasn't drawn a card yet
+            if self.has_drawn:
+                raise IllegalMoveError("Player has already drawn a card this turn")
+            if not from_deck and len(self.discard_pile) == 0:
+                raise IllegalMoveError("The discard pile is empty")
+
+        reshuffled = False
 
         # Draw card
         if from_deck:
-            drawn_card = self.deck.pop(0)
+            drawn_card = self.deck_cards[self.deck_position]
+            self.deck_position += 1
             self.get_hand().append(drawn_card)
 
-            self.player_knowledges[player].deck.remove(drawn_card)
+            self.player_knowledges[player].seen_cards.add(drawn_card)
 
             # If the deck has run out of cards, shuffle the discard pile (excluding the top-most card)
-            if len(self.deck) == 0:
-                self.deck = self.discard_pile.copy()
-                random.shuffle(self.deck)
-
-                self.discard_pile = []
+            if self.deck_position == len(self.deck_cards):
+                # Swap lists rather than copying; the discard pile becomes the deck, and the used-up deck list becomes the empty discard pile
+                new_deck = self.discard_pile
+                self.get_rng().shuffle(new_deck)
+
+                self.discard_pile = self.deck_cards
+                self.discard_pile.clear()
+                self.deck_cards = new_deck
+                self.deck_position = 0
+                reshuffled = True
                 
                 # Update card counting knowledge
-                for card in range(self.num_players):
-                    self.player_knowledges[card].deck = self.deck.copy()
+                self.reset_unseen_cards()
 
         else:
             drawn_card = self.discard_pile.pop()
@@ -154,42 +477,62 @@ class Game():
 
             # Update card counting
             for i in range(self.num_players):
-                self.player_knowledges[i].hands[player].append(drawn_card)
+                if i != player:
+                    self.player_knowledges[i].hands[player].append(drawn_card)
+
+        profiler = profiling.profiler
+        if profiler is not None:
+            profiler.start("knowledge updates")
 
         # Update knowledge
         # Add any new partial melds
         self.update_partial_melds(player, self.get_hand(player), self.get_hand(player)[-1])
 
+        if profiler is not None:
+            profiler.stop()
+
         # Sort the hands for easier legibility
         if self.human_readable:
             self.sort_cards(self.get_hand(), in_place=True)
 
         self.has_drawn = True
 
+        self.version += 1
+
+        if self.listeners:
+            if from_deck:
+                self._emit(DrewFromDeckEvent(player, drawn_card))
+            else:
+                self._emit(DrewFromDiscardEvent(player, drawn_card))
+
+            if reshuffled:
+                self._emit(ReshuffledEvent(self.deck))
+
     def discard(self, player:int, card_index:int) -> None:
-        # Assert that the game hasn't ended
-        assert not self.game_ended, "The game has ended; player cannot draw another card"
-        # Assert that the correct player is playing
-        assert player == self.whose_go, f"Player {player} can't draw a card because it's currently player {self.whose_go}'s turn"
-        # Check that player has drawn a card before discarding
-        assert self.has_drawn, "Player hasn't drawn a card yet"
-        # Check that the card index is within the number of cards in the hand
-        assert 0 <= card_index < len(self.get_hand()), f"Not able to discard card at index {card_index}; only {len(self.get_hand())} cards in the hand"
+        if self.strict:
+            self._check_turn(player, "discard a card")
+            # Check that player has drawn a card before discarding
+            if not self.has_drawn:
+                raise IllegalMoveError("Player hasn't drawn a card yet")
+            # Check that the card index is within the number of cards in the hand
+            if not 0 <= card_index < len(self.get_hand()):
+                raise IllegalMoveError(f"Not able to discard card at index {card_index}; only {len(self.get_hand())} cards in the hand")
 
         # Discard card
         discard_card = self.get_hand().pop(card_index)
         self.discard_pile.append(discard_card)
 
+        profiler = profiling.profiler
+        if profiler is not None:
+            profiler.start("knowledge updates")
+
         # Update card counting
         for i in range(self.num_players):
             try:
                 self.player_knowledges[i].hands[player].remove(discard_card)
             except ValueError:
                 pass
-            try:
-                self.player_knowledges[i].deck.remove(discard_card)
-            except ValueError:
-                pass
+        self.unseen_cards.pop(discard_card, None)
 
         # Update knowledge
         # Remove any partial melds which had the melded cards in
@@ -197,25 +540,41 @@ class Game():
             if discard_card in meld[0]:
                 self.player_knowledges[player].partial_melds.pop(ind)
 
+        if profiler is not None:
+            profiler.stop()
+
         self.has_drawn = False
 
-        # End turn
-        self._end_turn()
+        # End turn before telling listeners, as for the other moves. If the player has gone out, the game only ends once
+        # the discard has been sent, so listeners see the discard before the end of the game.
+        went_out = len(self.get_hand()) == 0
+        if not went_out:
+            self._end_turn()
+
+        self.version += 1
+
+        if self.listeners:
+            self._emit(DiscardedEvent(player, card_index, discard_card))
+
+        if went_out:
+            self._end_turn()
 
     def lay_meld(self, player:int, card_indices:list[int]) -> None:
-        # Assert that the game hasn't ended
-        assert not self.game_ended, "The game has ended; player cannot draw another card"
-        # Assert that the correct player is playing
-        assert player == self.whose_go, f"Player {player} can't draw a card because it's currently player {self.whose_go}'s turn"
-        # Assert that player has drawn a card before laying down a meld
-        assert self.has_drawn, "Player hasn't drawn a card yet"
-        # Assert that there'll be at least one card left in the player's hand after the meld is laid
-        assert len(self.get_hand()) > len(card_indices), "Can't play this meld; player must have a card to discard at the end of the turn"
-        # Assert that all values of list are in range
-        for index in card_indices:
-            assert 0 <= index < len(self.get_hand()), f"Not able to meld card at index {index}; only {len(self.get_hand())} cards in the hand"
-        # Assert that there are no duplicates in the list
-        assert len(card_indices) == len(set(card_indices)), "There are duplicates in the list"
+        if self.strict:
+            self._check_turn(player, "lay a meld")
+            # Check that player has drawn a card before laying down a meld
+            if not self.has_drawn:
+                raise IllegalMoveError("Player hasn't drawn a card yet")
+            # Check that there'll be at least one card left in the player's hand after the meld is laid
+            if len(self.get_hand()) <= len(card_indices):
+                raise IllegalMoveError("Can't play this meld; player must have a card to discard at the end of the turn")
+            # Check that all values of list are in range
+            for index in card_indices:
+                if not 0 <= index < len(self.get_hand()):
+                    raise IllegalMoveError(f"Not able to meld card at index {index}; only {len(self.get_hand())} cards in the hand")
+            # Check that there are no duplicates in the list
+            if len(card_indices) != len(set(card_indices)):
+                raise IllegalMoveError("There are duplicates in the list")
         
 
         # Cache old loose cards for comparison after meld
@@ -229,6 +588,9 @@ class Game():
         # If it's a valid meld on its own, then lay it down
         valid, meld_type = self.is_valid_meld(cards)
         if valid:
+            # Copy the cards for listeners before sorting reorders them
+            event = MeldLaidEvent(player, card_indices, cards.copy(), len(self.melds))
+
             if self.human_readable:
                 self.sort_cards(cards, in_place=True, is_meld=True)
             self.melds.append(cards)
@@ -237,13 +599,15 @@ class Game():
         
         else:
             # Otherwise check if it fits with any melds which have already been laid down
-            for existing_meld in self.melds:
+            for meld_index, existing_meld in enumerate(self.melds):
                 valid, meld_type = self.is_valid_meld(cards + existing_meld)
                 if valid:
                     existing_meld += cards
                     if self.human_readable:
                         self.sort_cards(existing_meld, in_place=True, is_meld=True)
                     valid_meld = True
+
+                    event = MeldExtendedEvent(player, card_indices, cards, meld_index)
                     break
             
             # Check if melds can be rearranged to fit
@@ -255,6 +619,8 @@ class Game():
                     meld, meld_locations, meld_type = self.try_rearrange_meld(cards, self.melds, self.meld_types)
 
                     if not meld is None:
+                        event = MeldRearrangedEvent(player, card_indices, cards, meld[len(cards):], meld_locations.copy())
+
                         meld_locations.sort(key=lambda x: x[0], reverse=True)
 
                         for location in meld_locations:
@@ -288,6 +654,10 @@ class Game():
         for index in sorted_indices:
             self.get_hand().pop(index)
 
+        profiler = profiling.profiler
+        if profiler is not None:
+            profiler.start("knowledge updates")
+
         # Update card counting
         for i in range(self.num_players):
             for card in cards:
@@ -295,11 +665,8 @@ class Game():
                     self.player_knowledges[i].hands[player].remove(card)
                 except ValueError:
                     pass
-
-                try:
-                    self.player_knowledges[i].deck.remove(card)
-                except ValueError:
-                    pass
+        for card in cards:
+            self.unseen_cards.pop(card, None)
 
         # Update knowledge
         new_loose_cards, _ = self.get_loose_meld_cards(self.melds, self.meld_types)
@@ -315,42 +682,39 @@ class Game():
             for ind, card in enumerate(added_loose_cards):
                 self.update_partial_melds(player, added_loose_cards[ind+1:], card)
 
+        if profiler is not None:
+            profiler.stop()
+
+        self.version += 1
+        self.melds_version += 1
+
+        if self.listeners:
+            self._emit(event)
+
 
     @staticmethod
     def sort_cards(cards:list[str], in_place:bool=False, is_meld=False) -> list[str] | None:
-        number_order = NUMBERS
+        sort_keys = CARD_SORT_KEYS
 
         # Handle KA2 melds
         if is_meld:
-            numbers_only = [card[0] for card in cards]
-            numbers_present = [num in numbers_only for num in NUMBERS]
-            numbers_present_doubled = numbers_present * 2
-
-            for i in range(len(numbers_present_doubled) - 1):
-                if numbers_present_doubled[i] == False and numbers_present_doubled[i+1] == True:
-                    # The start of the run is at i+1
-                    number_order = DOUBLED_NUMBERS[i+1 : i+1+len(NUMBERS)]
-                    break
-            
+            rank_mask = 0
+            for card in cards:
+                rank_mask |= 1 << CARD_RANKS[card]
+
+            sort_keys = MELD_SORT_KEYS[RUN_STARTS[rank_mask]]
 
         if in_place:
-            # Sort by suit
-            cards.sort(key=lambda x: SUITS.index(x[1]))
-            # Sort by number
-            cards.sort(key=lambda x: number_order.index(x[0]))
+            cards.sort(key=sort_keys.__getitem__)
 
         else:
-            # Sort by suit
-            cards = sorted(cards, key=lambda x: SUITS.index(x[1]))
-            # Sort by number
-            cards = sorted(cards, key=lambda x: number_order.index(x[0]))
-
-            return cards
+            return sorted(cards, key=sort_keys.__getitem__)
 
     @staticmethod
     def is_valid_meld(cards:list[str]) -> bool:
         # Check that there are no duplicates in the list
-        assert len(cards) == len(set(cards)), "There are duplicates in the list"
+        if len(cards) != len(set(cards)):
+            raise BadMeldError("There are duplicates in the list")
         
         # Check if the meld is a set
         def is_set():
@@ -386,31 +750,18 @@ class Game():
             return False, None
     
     @staticmethod
-    def get_possible_meld_friends(card:str) -> dict[str, list[str]]:
-
-        number_index : int = NUMBERS.index(card[0])
-        len_nums : int = len(NUMBERS)
-        
-        possible_friends : dict[str, list[str]] = {}
-        
-        def get_number_diff_card(difference : int):
-            return NUMBERS[(number_index + difference) % len_nums] + card[1]
-        possible_friends[get_number_diff_card(-2)] = [get_number_diff_card(-1)]
-        possible_friends[get_number_diff_card(-1)] = [get_number_diff_card(-2), get_number_diff_card(1)]
-        possible_friends[get_number_diff_card(1)] = [get_number_diff_card(-1), get_number_diff_card(2)]
-        possible_friends[get_number_diff_card(2)] = [get_number_diff_card(1)]
-        
+    def get_possible_meld_friends(card:str) -> dict[str, tuple[str, ...]]:
+        # Shared with every caller, so mustn't be modified
+        return MELD_FRIENDS[card]
 
-        for suit in SUITS:
-            if suit != card[1]:
-                possible_friends[card[0] + suit] = []
-
-                for suit_2 in SUITS:
-                    if suit_2 != card[1] and suit_2 != suit:
-                        possible_friends[card[0] + suit].append(card[0] + suit_2)
-            
-        return possible_friends
 
+    def _check_turn(self, player:int, action:str) -> None:
+        # Check that the game hasn't ended
+        if self.game_ended:
+            raise IllegalMoveError(f"The game has ended; player cannot {action}")
+        # Check that the correct player is playing
+        if player != self.whose_go:
+            raise IllegalMoveError(f"Player {player} can't {action} because it's currently player {self.whose_go}'s turn")
 
     def _end_turn(self) -> None:
         # Check if the player has cards left. If not, the game has ended
@@ -429,9 +780,40 @@ class Game():
         for player in range(self.num_players):
             self.scores[player] += self.get_score(self.get_hand(player))
 
+        self.version += 1
+
+        if self.listeners:
+            self._emit(GameEndedEvent(self.whose_go if len(self.get_hand()) == 0 else None, self.scores))
+
         # print(f"Game has ended. Player {self.whose_go} has won. Scores on the doors: {self.scores}")
 
 
+    @property
+    def deck(self) -> list[str]:
+        # Cards left in the deck, top first. This is a copy; use get_deck_size if only the size is needed
+        return self.deck_cards[self.deck_position:]
+
+    @deck.setter
+    def deck(self, cards:list[str]) -> None:
+        self.deck_cards = list(cards)
+        self.deck_position = 0
+
+    def get_rng(self):
+        return random if self.rng is None else self.rng
+
+    def get_deck_size(self) -> int:
+        return len(self.deck_cards) - self.deck_position
+
+    def reset_unseen_cards(self) -> None:
+        '''
+        After a reshuffle, everyone knows exactly which cards are in the deck, so the unseen cards are just the deck
+        '''
+        self.unseen_cards.clear()
+        self.unseen_cards.update(dict.fromkeys(self.deck))
+
+        for knowledge in self.player_knowledges:
+            knowledge.seen_cards.clear()
+
     def get_hand(self, player=None) -> list[str]:
         if player is None:
             player = self.whose_go
@@ -448,13 +830,111 @@ class Game():
         return score
     
     def get_knowledge(self, player:int) -> Knowledge:
-        # Assert that the correct player is playing
-        assert player == self.whose_go, f"Player {player} can't access knowledge; it's not their go"
-        
-        self.player_knowledges[player].hands[player] = self.get_hand(player).copy()
+        # Check that the correct player is playing
+        if self.strict and player != self.whose_go:
+            raise IllegalMoveError(f"Player {player} can't access knowledge; it's not their go")
 
         return self.player_knowledges[player]
 
+    def get_view(self, player:int) -> "GameView":
+        """
+        A read-only view of the game from a player's seat, for agents to make decisions from. Views are made once per player
+        and read the game's state directly, so they stay up to date.
+        """
+        if not self._views:
+            table = TableView(self)
+            self._views = [GameView(self, i, table) for i in range(self.num_players)]
+
+        return self._views[player]
+
+    def get_legal_actions(self) -> LegalActions:
+        """
+        The current player's legal moves. Worked out at most once per change to the game, and the part which depends only on
+        the melds on the table is kept until they change.
+        """
+        if self._legal_actions_version != self.version:
+            self._legal_actions = self._find_legal_actions()
+            self._legal_actions_version = self.version
+
+        return self._legal_actions
+
+    def _find_legal_actions(self) -> LegalActions:
+        if self.game_ended:
+            return LegalActions()
+
+        if not self.has_drawn:
+            return LegalActions(draw_from_deck=True, draw_from_discard=len(self.discard_pile) > 0)
+
+        hand = self.get_hand()
+
+        hand_indices = {CARD_BITS[card]: i for i, card in enumerate(hand)}
+        hand_mask = sum(hand_indices)
+
+        def get_indices(mask:int) -> tuple[int, ...]:
+            indices = []
+            while mask:
+                lowest_bit = mask & -mask
+                indices.append(hand_indices[lowest_bit])
+                mask ^= lowest_bit
+            return tuple(sorted(indices))
+
+        # Melds must leave a card in the hand to discard
+        meld_masks : set[int] = set()
+
+        # Fresh melds
+        for card in hand:
+            for meld in MELDS_BY_LOWEST_CARD[CARD_INDICES[card]]:
+                if meld & hand_mask == meld and meld != hand_mask:
+                    meld_masks.add(meld)
+
+        # Extensions of melds on the table
+        for extensions in self._get_meld_extensions():
+            for extension in extensions:
+                if extension & hand_mask == extension and extension != hand_mask:
+                    meld_masks.add(extension)
+
+        # Rearrangements of melds on the table, for one or two cards
+        if self.allow_rearranging:
+            excess_cards = sum(len(meld) - 3 for meld in self.melds)
+
+            candidates : list[list[str]] = []
+            if excess_cards >= 2 and len(hand) > 1:
+                candidates += [[card] for card in hand]
+            if excess_cards >= 1 and len(hand) > 2:
+                candidates += [[card_1, card_2] for i, card_1 in enumerate(hand) for card_2 in hand[i+1:]
+                               if card_1[0] == card_2[0] or card_1[1] == card_2[1]]
+
+            table_mask = sum(CARD_BITS[card] for meld in self.melds for card in meld)
+
+            for cards in candidates:
+                mask = sum(CARD_BITS[card] for card in cards)
+                if mask in meld_masks:
+                    continue
+
+                # Skip the full search unless the rest of some 3-card meld is on the table
+                if not any(meld & mask == mask and (meld ^ mask) & table_mask == meld ^ mask
+                           for meld in THREE_CARD_MELDS_BY_CARD[CARD_INDICES[cards[0]]]):
+                    continue
+
+                if not self.try_rearrange_meld(cards, self.melds, self.meld_types)[0] is None:
+                    meld_masks.add(mask)
+
+        return LegalActions(discard_mask=(1 << len(hand)) - 1, melds=tuple(sorted(get_indices(mask) for mask in meld_masks)))
+
+    def _get_meld_extensions(self) -> list[list[int]]:
+        """
+        For each meld on the table, the masks of every group of cards which could be added to it
+        """
+        if self._meld_extensions_version != self.melds_version:
+            self._meld_extensions = []
+            for meld in self.melds:
+                meld_mask = sum(CARD_BITS[card] for card in meld)
+                self._meld_extensions.append([extended ^ meld_mask for extended in MELD_MASKS
+                                              if extended & meld_mask == meld_mask and extended != meld_mask])
+            self._meld_extensions_version = self.melds_version
+
+        return self._meld_extensions
+
 
     def get_loose_meld_cards(self, melds:list[list[str]], meld_types:list[str]):
         loose_cards : list[str] = []
@@ -483,7 +963,8 @@ class Game():
         return loose_cards, loose_card_locations
 
     def try_rearrange_meld(self, proposed_meld:list[str], melds:list[list[str]], meld_types:list[str]):
-        assert len(proposed_meld) in [1, 2], f"Bad proposed meld length of {len(proposed_meld)}. Must be either 1 or 2"
+        if not len(proposed_meld) in [1, 2]:
+            raise ValueError(f"Bad proposed meld length of {len(proposed_meld)}. Must be either 1 or 2")
 
         # TODO possibly make this a recursive function? Or use a function to prevent repeating code
 
@@ -491,7 +972,9 @@ class Game():
             loose_cards_1, loose_card_locations_1 = self.get_loose_meld_cards(melds, meld_types)
 
             for card_1, location_1 in zip(loose_cards_1, loose_card_locations_1):
-                temp_melds = copy.deepcopy(melds)
+                # Only the meld losing a card needs copying
+                temp_melds = melds.copy()
+                temp_melds[location_1[0]] = melds[location_1[0]].copy()
                 temp_melds[location_1[0]].pop(location_1[1])
 
                 loose_cards_2, loose_card_locations_2 = self.get_loose_meld_cards(temp_melds, meld_types)
@@ -539,7 +1022,135 @@ class Game():
 
         for card in check_cards:
             if card in potential_friends.keys():
-                self.player_knowledges[player].partial_melds.append(([new_card, card], potential_friends[card]))
+                self.player_knowledges[player].partial_melds.append(((new_card, card), potential_friends[card]))
+
+
+class TableView:
+    """
+    Read-only view of the melds on the table, shared by every player's GameView of a game
+    """
+    __slots__ = ("_game", "__weakref__")
+
+    def __init__(self, game:Game) -> None:
+        self._game = game
+
+    @property
+    def melds(self) -> ReadOnlyList:
+        return ReadOnlyList([ReadOnlyList(meld) for meld in self._game.melds])
+
+    @property
+    def meld_types(self) -> ReadOnlyList:
+        return ReadOnlyList(self._game.meld_types)
+
+    @property
+    def melds_version(self) -> int:
+        return self._game.melds_version
+
+
+class GameView:
+    """
+    What one player can see of a game, without copying any of it. Lists come back as ReadOnlyLists over the game's own
+    lists, so agents can't change the game through a view.
+    """
+    __slots__ = ("_game", "_player", "_table")
+
+    def __init__(self, game:Game, player:int, table:TableView) -> None:
+        self._game = game
+        self._player = player
+        self._table = table
+
+    @property
+    def player(self) -> int:
+        return self._player
+
+    @property
+    def num_players(self) -> int:
+        return self._game.num_players
+
+    @property
+    def whose_go(self) -> int:
+        return self._game.whose_go
+
+    @property
+    def is_my_go(self) -> bool:
+        return self._game.whose_go == self._player
+
+    @property
+    def has_drawn(self) -> bool:
+        return self._game.has_drawn
+
+    @property
+    def game_ended(self) -> bool:
+        return self._game.game_ended
+
+    @property
+    def num_turns_taken(self) -> int:
+        return self._game.num_turns_taken
+
+    @property
+    def scores(self) -> ReadOnlyList:
+        return ReadOnlyList(self._game.scores)
+
+    # Cards
+    @property
+    def hand(self) -> ReadOnlyList:
+        return ReadOnlyList(self._game.hands[self._player])
+
+    @property
+    def hand_sizes(self) -> list[int]:
+        return [len(hand) for hand in self._game.hands]
+
+    @property
+    def deck_size(self) -> int:
+        return self._game.get_deck_size()
+
+    @property
+    def discard_pile(self) -> ReadOnlyList:
+        return ReadOnlyList(self._game.discard_pile)
+
+    @property
+    def discard_top(self) -> str | None:
+        discard_pile = self._game.discard_pile
+        return discard_pile[-1] if len(discard_pile) > 0 else None
+
+    @property
+    def table(self) -> TableView:
+        return self._table
+
+    # Knowledge
+    @property
+    def unseen_cards(self) -> UnseenCards:
+        return self._game.player_knowledges[self._player].deck
+
+    @property
+    def known_hands(self) -> ReadOnlyList:
+        """
+        For each player, the cards this player knows are in their hand
+        """
+        return ReadOnlyList([ReadOnlyList(hand) for hand in self._game.player_knowledges[self._player].hands])
+
+    @property
+    def partial_melds(self) -> ReadOnlyList:
+        return ReadOnlyList(self._game.player_knowledges[self._player].partial_melds)
+
+    @property
+    def beliefs(self) -> "np.ndarray | None":
+        beliefs = self._game.player_knowledges[self._player].beliefs
+        if beliefs is None:
+            return None
+
+        beliefs = beliefs.view()
+        beliefs.flags.writeable = False
+        return beliefs
+
+    @property
+    def legal_actions(self) -> LegalActions:
+        """
+        This player's legal moves; none unless it's their go
+        """
+        if self._game.whose_go != self._player:
+            return LegalActions()
+        return self._game.get_legal_actions()
 
 
 if __name__ == "__main__":
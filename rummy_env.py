@@ -0,0 +1,373 @@
+"""
+Gym-style environments over rummy.Game, for training agents other than Ginny.
+
+RummyEnv plays one seat of a game, with the other seats played by opponent agents (Ginny by default). reset() and step()
+follow the Gymnasium API, and each returns the observation and the legal action mask in info["action_mask"].
+VectorRummyEnv steps a batch of environments at once, either in-process or spread over subprocesses.
+
+Each environment deals from its own random generator, which reset(seed) seeds, so environments seeded the same deal the
+same games whichever process they run in. Opponents which make random choices of their own (eg "random") need to be
+given their own rng by the opponent factory to be reproducible.
+
+Observations and masks are written into preallocated NumPy buffers. The same arrays are returned every step, so copy
+them if they need to be kept.
+
+Actions:
+    0                       draw from the deck
+    1                       draw from the discard pile
+    DISCARD_OFFSET + c      discard card c (index into rummy.DECK)
+    MELD_OFFSET + m         lay meld m (index into hand_solver.ALL_MELDS) from the hand
+    LAY_OFF_OFFSET + c      lay card c onto a meld on the table, rearranging the table if that's allowed and needed
+
+Observation, float32 (card channels are 52 long, indexed like rummy.DECK):
+    card channels: own hand, top of the discard pile, rest of the discard pile, melded, unseen,
+                   then known to be in each opponent's hand (by seats after this one)
+    scalars: whether a card has been drawn this turn, deck size, turns taken, each opponent's hand size
+"""
+import multiprocessing
+import random
+from multiprocessing import shared_memory
+from typing import Callable
+
+import numpy as np
+
+import agents
+import hand_solver
+import rummy
+from ginny_gym import MAX_TURNS_PER_GAME
+
+
+NUM_DECK_CARDS = len(rummy.DECK)
+MAX_PLAYERS = max(rummy.NUM_CARDS.keys())
+MAX_HAND_SIZE = max(rummy.NUM_CARDS.values()) + 1
+
+# --- Actions ---
+ACTION_DRAW_DECK = 0
+ACTION_DRAW_DISCARD = 1
+DISCARD_OFFSET = 2
+MELD_OFFSET = DISCARD_OFFSET + NUM_DECK_CARDS
+LAY_OFF_OFFSET = MELD_OFFSET + len(hand_solver.ALL_MELDS)
+NUM_ACTIONS = LAY_OFF_OFFSET + NUM_DECK_CARDS
+MELD_ACTIONS : dict[int, int] = {meld: MELD_OFFSET + i for i, meld in enumerate(hand_solver.ALL_MELDS)}
+
+# --- Observation layout ---
+CHANNEL_HAND = 0
+CHANNEL_DISCARD_TOP = 1
+CHANNEL_DISCARD = 2
+CHANNEL_MELDED = 3
+CHANNEL_UNSEEN = 4
+CHANNEL_OPPONENTS = 5
+NUM_CHANNELS = CHANNEL_OPPONENTS + MAX_PLAYERS - 1
+SCALAR_OFFSET = NUM_CHANNELS * NUM_DECK_CARDS
+OBSERVATION_SIZE = SCALAR_OFFSET + 3 + MAX_PLAYERS - 1
+
+
+def make_ginny_opponent(game:rummy.Game, player:int) -> agents.Agent:
+    return agents.make_agent("ginny", game, player)
+
+
+class RummyEnv:
+    def __init__(self, num_players:int=2, player:int=0, opponent_factory:Callable=make_ginny_opponent,
+                 max_turns:int=MAX_TURNS_PER_GAME, observation:np.ndarray|None=None, action_mask:np.ndarray|None=None) -> None:
+        """
+        opponent_factory(game, seat) makes the agent for each other seat, eg partial(agents.make_agent, "greedy").
+        Buffers for the observation and action mask can be passed in, eg rows of a batch.
+        """
+        self.rng = random.Random()
+        self.game = rummy.Game(num_players, human_readable=False, strict=False, rng=self.rng)
+        self.player = player
+        self.max_turns = max_turns
+        self.opponents = {seat: opponent_factory(self.game, seat) for seat in range(num_players) if seat != player}
+
+        self.observation = np.zeros(OBSERVATION_SIZE, dtype=np.float32) if observation is None else observation
+        self.action_mask = np.zeros(NUM_ACTIONS, dtype=bool) if action_mask is None else action_mask
+        self.info = {"action_mask": self.action_mask}
+
+        self.old_score = 0
+        self.truncated = False
+
+    def reset(self, seed:int|None=None) -> tuple[np.ndarray, dict]:
+        if not seed is None:
+            self.rng.seed(seed)
+
+        game = self.game
+        if not game.game_ended:
+            game.end_game()
+
+        while True:
+            self.truncated = False
+            game.shuffle()
+            game.deal()
+            self.play_opponents()
+
+            if not game.game_ended:
+                break
+            # An opponent went out before this seat's first turn; deal again
+
+        self.old_score = game.scores[self.player]
+
+        self.update()
+        return self.observation, self.info
+
+    def step(self, action:int) -> tuple[np.ndarray, float, bool, bool, dict]:
+        if not self.action_mask[action]:
+            raise ValueError(f"Action {action} is not legal now")
+
+        game = self.game
+        hand = game.get_hand(self.player)
+
+        if action < DISCARD_OFFSET:
+            game.draw(self.player, from_deck=action == ACTION_DRAW_DECK)
+        elif action < MELD_OFFSET:
+            game.discard(self.player, hand.index(rummy.DECK[action - DISCARD_OFFSET]))
+        elif action < LAY_OFF_OFFSET:
+            cards = hand_solver.get_cards(hand_solver.ALL_MELDS[action - MELD_OFFSET])
+            game.lay_meld(self.player, [hand.index(card) for card in cards])
+        else:
+            game.lay_meld(self.player, [hand.index(rummy.DECK[action - LAY_OFF_OFFSET])])
+
+        self.play_opponents()
+
+        # Rewarded with minus the points scored at the end of the game
+        reward = 0.0
+        if game.game_ended:
+            reward = float(self.old_score - game.scores[self.player])
+
+        self.update()
+        return self.observation, reward, game.game_ended and not self.truncated, self.truncated, self.info
+
+    def play_opponents(self) -> None:
+        game = self.game
+
+        while not game.game_ended:
+            if game.num_turns_taken >= self.max_turns:
+                self.truncated = True
+                game.end_game()
+                break
+
+            if game.whose_go == self.player:
+                break
+
+            self.opponents[game.whose_go].take_turn()
+
+    def update(self) -> None:
+        """
+        Rewrite the observation and action mask buffers in place
+        """
+        game = self.game
+        player = self.player
+        observation = self.observation
+        card_indices = rummy.CARD_INDICES
+
+        observation[:] = 0
+        hand = game.get_hand(player)
+        knowledge = game.player_knowledges[player]
+
+        for card in hand:
+            observation[CHANNEL_HAND * NUM_DECK_CARDS + card_indices[card]] = 1
+        if game.discard_pile:
+            observation[CHANNEL_DISCARD_TOP * NUM_DECK_CARDS + card_indices[game.discard_pile[-1]]] = 1
+            for card in game.discard_pile[:-1]:
+                observation[CHANNEL_DISCARD * NUM_DECK_CARDS + card_indices[card]] = 1
+        for meld in game.melds:
+            for card in meld:
+                observation[CHANNEL_MELDED * NUM_DECK_CARDS + card_indices[card]] = 1
+        for card in knowledge.deck:
+            observation[CHANNEL_UNSEEN * NUM_DECK_CARDS + card_indices[card]] = 1
+
+        for i in range(1, game.num_players):
+            seat = (player + i) % game.num_players
+            offset = (CHANNEL_OPPONENTS + i - 1) * NUM_DECK_CARDS
+            for card in knowledge.hands[seat]:
+                observation[offset + card_indices[card]] = 1
+            observation[SCALAR_OFFSET + 2 + i] = len(game.get_hand(seat)) / MAX_HAND_SIZE
+
+        observation[SCALAR_OFFSET] = game.has_drawn
+        observation[SCALAR_OFFSET + 1] = game.get_deck_size() / NUM_DECK_CARDS
+        observation[SCALAR_OFFSET + 2] = game.num_turns_taken / self.max_turns
+
+        self.update_action_mask()
+
+    def update_action_mask(self) -> None:
+        game = self.game
+        action_mask = self.action_mask
+        action_mask[:] = False
+
+        if game.game_ended or game.whose_go != self.player:
+            return
+
+        legal_actions = game.get_legal_actions()
+        action_mask[ACTION_DRAW_DECK] = legal_actions.draw_from_deck
+        action_mask[ACTION_DRAW_DISCARD] = legal_actions.draw_from_discard
+
+        hand = game.get_hand(self.player)
+        card_indices = rummy.CARD_INDICES
+
+        for i, card in enumerate(hand):
+            if legal_actions.discard_mask >> i & 1:
+                action_mask[DISCARD_OFFSET + card_indices[card]] = True
+
+        # Groups of several cards are only actions if they're a meld on their own
+        for indices in legal_actions.melds:
+            if len(indices) == 1:
+                action_mask[LAY_OFF_OFFSET + card_indices[hand[indices[0]]]] = True
+            else:
+                meld_action = MELD_ACTIONS.get(sum(rummy.CARD_BITS[hand[i]] for i in indices))
+                if not meld_action is None:
+                    action_mask[meld_action] = True
+
+
+# --- Vectorised environments ---
+
+def allocate_buffers(num_envs:int, buffer=None) -> dict[str, np.ndarray]:
+    """
+    Batch buffers for observations, masks, rewards and done flags, laid out one after another in buffer (eg shared memory)
+    if given. With no buffer, returns the number of bytes needed under "size".
+    """
+    layout = [
+        ("observations", np.float32, (num_envs, OBSERVATION_SIZE)),
+        ("rewards", np.float32, (num_envs,)),
+        ("action_masks", np.bool_, (num_envs, NUM_ACTIONS)),
+        ("terminated", np.bool_, (num_envs,)),
+        ("truncated", np.bool_, (num_envs,)),
+    ]
+
+    buffers : dict[str, np.ndarray] = {}
+    offset = 0
+    for name, dtype, shape in layout:
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if not buffer is None:
+            buffers[name] = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+        offset += size
+
+    if buffer is None:
+        return {"size": offset}
+    return buffers
+
+def make_envs(buffers:dict[str, np.ndarray], start:int, end:int, env_kwargs:dict) -> list[RummyEnv]:
+    return [RummyEnv(observation=buffers["observations"][i], action_mask=buffers["action_masks"][i], **env_kwargs) for i in range(start, end)]
+
+def step_envs(envs:list[RummyEnv], buffers:dict[str, np.ndarray], start:int, actions:np.ndarray) -> None:
+    """
+    Step each environment, writing its results into row start + i of the buffers. Finished environments are reset, so the
+    observation is the first of the next game.
+    """
+    for i, (env, action) in enumerate(zip(envs, actions)):
+        _, reward, terminated, truncated, _ = env.step(int(action))
+        buffers["rewards"][start + i] = reward
+        buffers["terminated"][start + i] = terminated
+        buffers["truncated"][start + i] = truncated
+
+        if terminated or truncated:
+            env.reset()
+
+def reset_envs(envs:list[RummyEnv], buffers:dict[str, np.ndarray], start:int, seed:int|None) -> None:
+    for i, env in enumerate(envs):
+        env.reset(None if seed is None else seed + start + i)
+        buffers["rewards"][start + i] = 0
+        buffers["terminated"][start + i] = False
+        buffers["truncated"][start + i] = False
+
+def run_env_worker(shm_name:str, num_envs:int, start:int, end:int, env_kwargs:dict, conn) -> None:
+    shm = shared_memory.SharedMemory(shm_name)
+    buffers = allocate_buffers(num_envs, shm.buf)
+    envs = make_envs(buffers, start, end, env_kwargs)
+
+    try:
+        while True:
+            command, argument = conn.recv()
+            if command == "step":
+                step_envs(envs, buffers, start, argument)
+            elif command == "reset":
+                reset_envs(envs, buffers, start, argument)
+            elif command == "close":
+                break
+            conn.send(None)
+    finally:
+        del buffers, envs
+        shm.close()
+        conn.close()
+
+
+class VectorRummyEnv:
+    """
+    A batch of RummyEnvs, stepped together. Finished environments reset themselves.
+
+    backend "inprocess" steps every environment in this process; "subprocess" splits them over num_workers processes, which
+    write straight into shared memory, so only the actions are sent each step.
+    """
+    def __init__(self, num_envs:int, backend:str="inprocess", num_workers:int|None=None, **env_kwargs) -> None:
+        if not backend in ["inprocess", "subprocess"]:
+            raise ValueError(f"Invalid backend, must be one of {['inprocess', 'subprocess']}")
+
+        self.num_envs = num_envs
+        self.backend = backend
+
+        if backend == "inprocess":
+            self.shm = None
+            self.buffers = allocate_buffers(num_envs, bytearray(allocate_buffers(num_envs)["size"]))
+            self.envs = make_envs(self.buffers, 0, num_envs, env_kwargs)
+            return
+
+        if num_workers is None:
+            num_workers = min(num_envs, multiprocessing.cpu_count())
+
+        self.shm = shared_memory.SharedMemory(create=True, size=allocate_buffers(num_envs)["size"])
+        self.buffers = allocate_buffers(num_envs, self.shm.buf)
+
+        # Split the environments as evenly as possible
+        bounds = [num_envs * i // num_workers for i in range(num_workers + 1)]
+        self.slices = list(zip(bounds[:-1], bounds[1:]))
+        self.connections = []
+        self.processes = []
+        for start, end in self.slices:
+            conn, worker_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=run_env_worker, args=(self.shm.name, num_envs, start, end, env_kwargs, worker_conn), daemon=True)
+            process.start()
+            self.connections.append(conn)
+            self.processes.append(process)
+
+    @property
+    def observations(self) -> np.ndarray:
+        return self.buffers["observations"]
+
+    @property
+    def action_masks(self) -> np.ndarray:
+        return self.buffers["action_masks"]
+
+    def reset(self, seed:int|None=None) -> tuple[np.ndarray, dict]:
+        """
+        Environment i is seeded with seed + i
+        """
+        if self.backend == "inprocess":
+            reset_envs(self.envs, self.buffers, 0, seed)
+        else:
+            self._run_workers("reset", [seed] * len(self.slices))
+
+        return self.buffers["observations"], {"action_mask": self.buffers["action_masks"]}
+
+    def step(self, actions:np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, dict]:
+        if self.backend == "inprocess":
+            step_envs(self.envs, self.buffers, 0, actions)
+        else:
+            self._run_workers("step", [actions[start:end] for start, end in self.slices])
+
+        buffers = self.buffers
+        return buffers["observations"], buffers["rewards"], buffers["terminated"], buffers["truncated"], {"action_mask": buffers["action_masks"]}
+
+    def _run_workers(self, command:str, arguments:list) -> None:
+        for conn, argument in zip(self.connections, arguments):
+            conn.send((command, argument))
+        for conn in self.connections:
+            conn.recv()
+
+    def close(self) -> None:
+        if self.backend == "subprocess":
+            for conn in self.connections:
+                conn.send(("close", None))
+            for process in self.processes:
+                process.join()
+
+            self.buffers = None
+            self.shm.close()
+            self.shm.unlink()
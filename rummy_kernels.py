@@ -0,0 +1,150 @@
+"""
+Numba-compiled versions of the rummy engine's hot card routines, for Game(backend="numba").
+
+Cards are encoded as their index into rummy.DECK (suit * 13 + rank), so the kernels only do integer arithmetic. Numba is
+optional; if it isn't installed the numba backend isn't available and Game falls back to the pure Python reference.
+Only routines which gain from compiling once the cards are encoded are swapped in, which is just meld validation. Scoring
+is a single lookup per card, so encoding the cards costs more than it saves, and finding meld friends and loose meld
+cards build lists of card strings, which Numba can't speed up.
+
+Run this file to check the kernels agree with the reference implementation and to time them:
+    python rummy_kernels.py
+"""
+import random
+import timeit
+
+import rummy
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+NUMBA_AVAILABLE = numba is not None
+NUM_RANKS = len(rummy.NUMBERS)
+CARD_INDEX = rummy.CARD_INDICES.__getitem__
+
+# Results of meld_type_kernel
+DUPLICATES, INVALID, SET, RUN = -1, 0, 1, 2
+MELD_TYPE_RESULTS : dict[int, tuple[bool, str | None]] = {INVALID: (False, None), SET: (True, "set"), RUN: (True, "run")}
+
+
+def encode(cards:list[str]) -> tuple[int, ...]:
+    # A tuple is quicker to build and pass to a kernel than an array, at the cost of a compile per length
+    return tuple(map(CARD_INDEX, cards))
+
+
+# --- Kernels, written to compile with numba.njit ---
+def meld_type_kernel(cards:tuple[int, ...]) -> int:
+    # Duplicates are checked first, as in Game.is_valid_meld
+    seen = 0
+    for card in cards:
+        bit = 1 << card
+        if seen & bit:
+            return DUPLICATES
+        seen |= bit
+
+    num_cards = len(cards)
+    if num_cards < 3:
+        return INVALID
+
+    # Set: every card has the same rank
+    rank = cards[0] % NUM_RANKS
+    is_set = True
+    for card in cards:
+        if card % NUM_RANKS != rank:
+            is_set = False
+            break
+    if is_set:
+        return SET
+
+    # Run: one suit, and the ranks are consecutive, possibly wrapping from K round to A
+    suit = cards[0] // NUM_RANKS
+    rank_mask = 0
+    for card in cards:
+        if card // NUM_RANKS != suit:
+            return INVALID
+        rank_mask |= 1 << (card % NUM_RANKS)
+
+    all_ranks = (1 << NUM_RANKS) - 1
+    run_mask = (1 << num_cards) - 1
+    for start in range(NUM_RANKS):
+        if ((run_mask << start) | (run_mask >> (NUM_RANKS - start))) & all_ranks == rank_mask:
+            return RUN
+
+    return INVALID
+
+
+if NUMBA_AVAILABLE:
+    meld_type_kernel = numba.njit(cache=True)(meld_type_kernel)
+
+
+# --- Drop-in replacements for Game's methods ---
+def is_valid_meld(cards:list[str]) -> tuple[bool, str | None]:
+    # Numba can't iterate over an empty tuple
+    if len(cards) == 0:
+        return False, None
+
+    meld_type = meld_type_kernel(encode(cards))
+    if meld_type == DUPLICATES:
+        raise rummy.BadMeldError("There are duplicates in the list")
+
+    return MELD_TYPE_RESULTS[meld_type]
+
+def install(game:rummy.Game) -> None:
+    """
+    Swap the kernels in for a game's own methods. Static calls through rummy.Game keep using the reference.
+    """
+    game.is_valid_meld = is_valid_meld
+
+
+def get_test_cards(rng:random.Random) -> list[str]:
+    """
+    A mix of valid melds, near misses and random (possibly duplicated) cards
+    """
+    kind = rng.randrange(3)
+    if kind < 2:
+        meld = rng.choice(rummy.MELD_MASKS)
+        cards = [card for card in rummy.DECK if meld & rummy.CARD_BITS[card]]
+        if kind == 1:
+            cards[rng.randrange(len(cards))] = rng.choice(rummy.DECK)
+    else:
+        cards = [rng.choice(rummy.DECK) for _ in range(rng.randrange(7))]
+
+    rng.shuffle(cards)
+    return cards
+
+def check_parity(num_cases:int=100000, seed:int=0) -> int:
+    """
+    Compare the kernels with the reference on random card lists, printing and returning the number of mismatches
+    """
+    rng = random.Random(seed)
+    mismatches = 0
+
+    for _ in range(num_cases):
+        cards = get_test_cards(rng)
+
+        results = []
+        for function in (rummy.Game.is_valid_meld, is_valid_meld):
+            try:
+                results.append(function(cards))
+            except rummy.BadMeldError:
+                results.append("BadMeldError")
+
+        if results[0] != results[1]:
+            mismatches += 1
+            print(f"Mismatch for {cards}: {results}")
+
+    print(f"{num_cases} cases, {mismatches} mismatches")
+    return mismatches
+
+
+if __name__ == "__main__":
+    print(f"Numba {'available' if NUMBA_AVAILABLE else 'not installed; checking the uncompiled kernels'}")
+    check_parity()
+
+    for name, cards in [("run", ["3♣", "4♣", "5♣", "6♣"]), ("set", ["7♦", "7♥", "7♠"]), ("invalid", ["3♣", "4♦", "9♠"])]:
+        times = [min(timeit.repeat(lambda: function(cards), number=10000, repeat=5)) / 10000 * 1e6
+                 for function in (rummy.Game.is_valid_meld, is_valid_meld)]
+        print(f"is_valid_meld[{name}]: reference {times[0]:.2f} µs, kernel {times[1]:.2f} µs")
@@ -0,0 +1,206 @@
+"""
+Headless self-play between Ginny genomes, for benchmarking the engine/agents and evaluating champion genomes.
+
+Usage:
+    python self_play.py ginny_genome.gn other_genome.gn --games 1000 --players 4
+    python self_play.py ginny_genome.gn greedy --games 1000
+
+Seats are filled by cycling through the given genome files, so a single genome plays against itself. The name of an agent
+registered in agents.AGENTS (eg random, greedy) can be given instead of a genome file, to play against a baseline.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import time
+from dataclasses import dataclass, asdict
+
+import numpy as np
+from tqdm import tqdm
+
+import agents
+import ginny
+import rummy
+from ginny_gym import MAX_TURNS_PER_GAME
+
+
+GAMES_PER_TASK = 10
+
+
+@dataclass
+class GameResult:
+    winner : int | None # Seat which went out; None if the game hit the turn limit
+    scores : list[int]
+    num_turns : int
+    turn_times : list[float] # secs
+
+
+# Per-worker state, set up once by init_worker
+worker_seats : list[str] = []
+worker_genomes : dict[str, object] = {}
+worker_config = None
+worker_backend = "python"
+
+
+def is_agent_name(seat:str) -> bool:
+    return seat in agents.AGENTS and not os.path.exists(seat)
+
+def init_worker(seats:list[str], config_file:str, backend:str="python") -> None:
+    global worker_seats, worker_genomes, worker_config, worker_backend
+
+    worker_seats = seats
+    worker_genomes = {seat: ginny.Ginny.get_genome(seat) for seat in seats if not is_agent_name(seat)}
+    worker_config = ginny.Ginny.get_config(config_file) if worker_genomes else None
+    worker_backend = backend
+
+def make_seat_agent(seat:str, game:rummy.Game, player:int) -> agents.Agent:
+    if seat in worker_genomes:
+        return ginny.Ginny(game, player, worker_genomes[seat], worker_config, human_delay=0)
+    return agents.make_agent(seat, game, player)
+
+def play_games(task:tuple[int, int, int, int]) -> list[GameResult]:
+    num_players, num_games, max_turns, seed = task
+
+    random.seed(seed)
+
+    game = rummy.Game(num_players, human_readable=False, strict=False, backend=worker_backend)
+    players = [make_seat_agent(worker_seats[i % len(worker_seats)], game, i) for i in range(num_players)]
+
+    results : list[GameResult] = []
+
+    for _ in range(num_games):
+        old_scores = game.scores.copy()
+        turn_times : list[float] = []
+
+        game.shuffle()
+        game.deal()
+
+        while not game.game_ended:
+            if game.num_turns_taken >= max_turns:
+                game.end_game()
+                break
+
+            start_time = time.perf_counter()
+            players[game.whose_go].take_turn()
+            turn_times.append(time.perf_counter() - start_time)
+
+        results.append(GameResult(
+            game.whose_go if len(game.get_hand()) == 0 else None,
+            [new - old for new, old in zip(game.scores, old_scores)],
+            game.num_turns_taken,
+            turn_times))
+
+    return results
+
+
+def run(genome_files:list[str], config_file:str=ginny.CONFIG_FILE_NAME, num_games:int=100, num_players:int=2,
+        num_workers:int|None=None, max_turns:int=MAX_TURNS_PER_GAME, seed:int|None=None, output_file:str|None=None,
+        backend:str="python") -> dict:
+    if not num_players in rummy.NUM_CARDS.keys():
+        raise ValueError(f"Invalid number of players, must be one of {list(rummy.NUM_CARDS.keys())}")
+
+    if num_workers is None:
+        num_workers = os.cpu_count()
+    if seed is None:
+        seed = random.randrange(2**32)
+
+    # Split games into small tasks so results stream back as they complete
+    tasks = []
+    for i in range(0, num_games, GAMES_PER_TASK):
+        tasks.append((num_players, min(GAMES_PER_TASK, num_games - i), max_turns, seed + i))
+
+    # Keyed by the path as given, so genome files with the same name in different folders are counted separately
+    seat_agents = [genome_files[i % len(genome_files)] for i in range(num_players)]
+    agent_names = list(dict.fromkeys(seat_agents))
+
+    wins = {name: 0 for name in agent_names}
+    seats_played = {name: 0 for name in agent_names}
+    total_scores = {name: 0 for name in agent_names}
+    num_unfinished = 0
+    num_turns = 0
+    turn_times : list[np.ndarray] = []
+
+    output = open(output_file, "w") if output_file else None
+
+    start_time = time.perf_counter()
+    with multiprocessing.Pool(num_workers, initializer=init_worker, initargs=(genome_files, config_file, backend)) as pool:
+        with tqdm(total=num_games, unit="game") as progress:
+            for results in pool.imap_unordered(play_games, tasks):
+                for result in results:
+                    for seat, name in enumerate(seat_agents):
+                        seats_played[name] += 1
+                        total_scores[name] += result.scores[seat]
+                    if result.winner is None:
+                        num_unfinished += 1
+                    else:
+                        wins[seat_agents[result.winner]] += 1
+
+                    num_turns += result.num_turns
+                    turn_times.append(np.array(result.turn_times, dtype=np.float32))
+
+                    if output:
+                        output.write(json.dumps({key: value for key, value in asdict(result).items() if key != "turn_times"}) + "\n")
+
+                progress.update(len(results))
+    time_diff = time.perf_counter() - start_time
+
+    if output:
+        output.close()
+
+    all_turn_times = np.concatenate(turn_times) if turn_times else np.zeros(1)
+
+    report = {
+        "games": num_games,
+        "players": num_players,
+        "workers": num_workers,
+        "backend": backend,
+        "seed": seed,
+        "time": time_diff,
+        "games_per_sec": num_games / time_diff,
+        "turns_per_sec": num_turns / time_diff,
+        "av_game_length": num_turns / num_games,
+        "turn_latency_p50_us": float(np.percentile(all_turn_times, 50)) * 1e6,
+        "turn_latency_p99_us": float(np.percentile(all_turn_times, 99)) * 1e6,
+        "unfinished_games": num_unfinished,
+        # Win rate per seat, so agents filling several seats are comparable with those filling one
+        "win_rates": {name: wins[name] / seats_played[name] for name in agent_names},
+        "av_scores": {name: total_scores[name] / seats_played[name] for name in agent_names},
+    }
+
+    return report
+
+def print_report(report:dict) -> None:
+    print(f"\n{report['games']} games, {report['players']} players, {report['workers']} workers, seed {report['seed']}",
+          f"Time: {report['time']:.2f} s",
+          f"{report['games_per_sec']:.1f} games/s",
+          f"{report['turns_per_sec']:.0f} turns/s",
+          f"Av game length: {report['av_game_length']:.1f} turns",
+          f"Turn latency p50: {report['turn_latency_p50_us']:.0f} µs, p99: {report['turn_latency_p99_us']:.0f} µs",
+          f"Unfinished games: {report['unfinished_games']}",
+          sep="\n")
+    for name in report["win_rates"]:
+        print(f"  {name}: win rate per seat {report['win_rates'][name]:.3f}, av score per game {report['av_scores'][name]:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play Ginny genomes against each other headlessly and report throughput and win rates")
+    parser.add_argument("genomes", nargs="*", default=[ginny.GENOME_FILE_NAME], help="Genome files or registered agent names; seats are filled by cycling through these")
+    parser.add_argument("--config", default=ginny.CONFIG_FILE_NAME, help="NEAT config file")
+    parser.add_argument("--games", type=int, default=100, help="Number of games to play")
+    parser.add_argument("--players", type=int, default=2, choices=list(rummy.NUM_CARDS.keys()), help="Number of players per game")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: all cores)")
+    parser.add_argument("--max-turns", type=int, default=MAX_TURNS_PER_GAME, help="Turn limit per game")
+    parser.add_argument("--seed", type=int, default=None, help="Base random seed")
+    parser.add_argument("--output", default=None, help="Stream per-game results to this JSON lines file")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--backend", default="python", choices=rummy.BACKENDS, help="Engine backend; see rummy_kernels")
+    args = parser.parse_args()
+
+    report = run(args.genomes, args.config, args.games, args.players, args.workers, args.max_turns, args.seed, args.output,
+                 args.backend)
+
+    if args.json:
+        print(json.dumps(report, indent=4))
+    else:
+        print_report(report)
@@ -0,0 +1,99 @@
+"""
+Broadcast a generation's compiled networks to worker processes through shared memory, so matches only need to send genome
+ids rather than pickling whole genomes for every match.
+
+The block is a flat float64 array:
+    number of genomes N
+    index: (genome id, offset, length) for each of the N genomes
+    networks, one after another, each: number of nodes, then for each node in evaluation order
+        node key, activation index, aggregation index, bias, response, number of links, then (input key, weight) per link
+Activation and aggregation indices are into the sorted function names of the NEAT config.
+"""
+from multiprocessing import shared_memory
+
+import neat
+import numpy as np
+
+
+def get_function_names(config:neat.Config) -> tuple[list[str], list[str]]:
+    return sorted(config.genome_config.activation_defs.functions), sorted(config.genome_config.aggregation_function_defs.functions)
+
+def encode_network(genome:neat.DefaultGenome, config:neat.Config) -> list[float]:
+    activation_names, aggregation_names = get_function_names(config)
+    activation_indices = {config.genome_config.activation_defs.get(name): i for i, name in enumerate(activation_names)}
+    aggregation_indices = {config.genome_config.aggregation_function_defs.get(name): i for i, name in enumerate(aggregation_names)}
+
+    nn = neat.nn.FeedForwardNetwork.create(genome, config)
+
+    data = [len(nn.node_evals)]
+    for node, activation, aggregation, bias, response, links in nn.node_evals:
+        data += [node, activation_indices[activation], aggregation_indices[aggregation], bias, response, len(links)]
+        for input_node, weight in links:
+            data += [input_node, weight]
+
+    return data
+
+
+class SharedPopulation:
+    """
+    Attach to a population written by SharedPopulation.create, given the shared memory block's name
+    """
+    def __init__(self, name:str, owner:bool=False) -> None:
+        self.shm = shared_memory.SharedMemory(name)
+        # Only the creator unlinks the block
+        self.owner = owner
+
+        self.data = np.ndarray((self.shm.size // 8,), dtype=np.float64, buffer=self.shm.buf)
+
+        num_genomes = int(self.data[0])
+        index = self.data[1 : 1 + 3 * num_genomes].reshape(-1, 3).astype(np.int64)
+        self.index : dict[int, tuple[int, int]] = {int(genome_id): (int(offset), int(length)) for genome_id, offset, length in index}
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @classmethod
+    def create(cls, genomes:list[tuple[int, neat.DefaultGenome]], config:neat.Config) -> "SharedPopulation":
+        networks = [encode_network(genome, config) for _, genome in genomes]
+
+        header = [len(genomes)]
+        offset = 1 + 3 * len(genomes)
+        for (genome_id, _), network in zip(genomes, networks):
+            header += [genome_id, offset, len(network)]
+            offset += len(network)
+
+        shm = shared_memory.SharedMemory(create=True, size=offset * 8)
+        data = np.ndarray((offset,), dtype=np.float64, buffer=shm.buf)
+        data[:] = header + [value for network in networks for value in network]
+        del data
+        shm.close()
+
+        return cls(shm.name, owner=True)
+
+    def __contains__(self, genome_id:int) -> bool:
+        return genome_id in self.index
+
+    def get_network(self, genome_id:int, config:neat.Config) -> neat.nn.FeedForwardNetwork:
+        activation_names, aggregation_names = get_function_names(config)
+        offset, length = self.index[genome_id]
+        values = self.data[offset : offset + length].tolist()
+
+        node_evals = []
+        i = 1
+        for _ in range(int(values[0])):
+            node, activation, aggregation, bias, response, num_links = values[i : i+6]
+            links = [(int(values[i + 6 + 2*j]), values[i + 7 + 2*j]) for j in range(int(num_links))]
+            node_evals.append((int(node),
+                               config.genome_config.activation_defs.get(activation_names[int(activation)]),
+                               config.genome_config.aggregation_function_defs.get(aggregation_names[int(aggregation)]),
+                               bias, response, links))
+            i += 6 + 2 * int(num_links)
+
+        return neat.nn.FeedForwardNetwork(config.genome_config.input_keys, config.genome_config.output_keys, node_evals)
+
+    def close(self) -> None:
+        self.data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
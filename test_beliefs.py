@@ -0,0 +1,59 @@
+"""
+Belief tracking and hand sampling over whole games of random agents
+"""
+import random
+
+import numpy as np
+import pytest
+
+import agents
+import beliefs
+import rummy
+
+
+NUM_GAMES = 10
+MAX_TURNS = 300
+
+
+def check_sample(hands:list[list[str]], game:rummy.Game, player:int, player_beliefs:np.ndarray) -> None:
+    assert hands[player] == game.get_hand(player)
+    assert [len(hand) for hand in hands] == [len(hand) for hand in game.hands]
+
+    # Every card is sampled at most once, and never from somewhere the player can see
+    sampled = [card for hand in hands for card in hand]
+    assert len(set(sampled)) == len(sampled)
+    assert not set(sampled) & set(game.discard_pile)
+    assert not set(sampled) & {card for meld in game.melds for card in meld}
+
+    for opponent, hand in enumerate(hands):
+        known = {rummy.DECK[card] for card in np.flatnonzero(player_beliefs[:, opponent] >= 1)}
+        assert known <= set(hand)
+
+
+@pytest.mark.parametrize("num_players", [3, 4])
+def test_sample_hands_every_turn_past_reshuffles(num_players):
+    random.seed(num_players)
+    rng = np.random.default_rng(num_players)
+
+    game = rummy.Game(num_players, human_readable=False, strict=False)
+    tracker = beliefs.BeliefTracker(game)
+    players = [agents.make_agent("random", game, player) for player in range(num_players)]
+
+    num_reshuffles = 0
+    def count_reshuffles(event:rummy.GameEvent) -> None:
+        nonlocal num_reshuffles
+        num_reshuffles += isinstance(event, rummy.ReshuffledEvent)
+    game.add_listener(count_reshuffles)
+
+    for _ in range(NUM_GAMES):
+        game.shuffle()
+        game.deal()
+
+        while not game.game_ended and game.num_turns_taken < MAX_TURNS:
+            players[game.whose_go].take_turn()
+
+            for player in range(num_players):
+                player_beliefs = tracker.beliefs[player]
+                check_sample(beliefs.sample_hands(player_beliefs, game, player, rng), game, player, player_beliefs)
+
+    assert num_reshuffles > 0
@@ -0,0 +1,146 @@
+"""
+Coordinator and workers on loopback, with ginny_gym.play_match swapped for stand-ins so no real games are played
+"""
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+
+import pytest
+
+import distributed
+import ginny_gym
+
+
+NUM_MATCHES = 4
+TIMEOUT = 30 # secs
+
+fork = multiprocessing.get_context("fork")
+
+
+def play_match_slowly(genome_group, config, num_games):
+    time.sleep(TIMEOUT)
+
+def play_match_quickly(genome_group, config, num_games):
+    return ginny_gym.MatchResult({genome_id: -1.0 for genome_id, _ in genome_group}, 1, num_games, None)
+
+def play_match_badly(genome_group, config, num_games):
+    if (0, None) in genome_group:
+        raise ValueError("Bad match")
+    return play_match_quickly(genome_group, config, num_games)
+
+
+def run_worker_in_own_group(*args) -> None:
+    # So the worker can be killed along with its pool, which shares its connection to the coordinator
+    os.setpgrp()
+    distributed.run_worker(*args)
+
+def start_worker(coordinator:distributed.Coordinator, monkeypatch, play_match) -> multiprocessing.Process:
+    # Not a daemon, as workers start their own process pool
+    monkeypatch.setattr(ginny_gym, "play_match", play_match)
+    worker = fork.Process(target=run_worker_in_own_group, args=(*coordinator.address, coordinator.authkey, 2))
+    worker.start()
+    coordinator.test_workers.append(worker)
+    return worker
+
+def kill_worker(worker:multiprocessing.Process) -> None:
+    try:
+        os.killpg(worker.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    worker.join()
+
+def play_matches(coordinator:distributed.Coordinator, genome_groups:list[frozenset]) -> list:
+    # In a thread, so a coordinator which never finishes fails the test rather than hanging it
+    results = []
+    thread = threading.Thread(target=lambda: results.append(coordinator.play_matches(genome_groups, None, 1)), daemon=True)
+    thread.start()
+    thread.join(TIMEOUT)
+    assert results, "Timed out"
+    return results[0]
+
+def wait_for(condition) -> None:
+    end = time.time() + TIMEOUT
+    while not condition():
+        assert time.time() < end, "Timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def coordinator():
+    coordinator = distributed.Coordinator(port=0)
+    coordinator.test_workers = []
+    yield coordinator
+    coordinator.close()
+    for worker in coordinator.test_workers:
+        kill_worker(worker)
+
+@pytest.fixture
+def genome_groups() -> list[frozenset]:
+    return [frozenset({(i, None), (i + NUM_MATCHES, None)}) for i in range(NUM_MATCHES)]
+
+
+def test_listens_on_loopback_with_a_random_key(coordinator):
+    assert coordinator.address[0] == "127.0.0.1"
+    assert len(coordinator.authkey) >= 32
+    assert distributed.Coordinator(port=0).authkey != coordinator.authkey
+
+def test_lost_worker_batch_is_requeued(coordinator, genome_groups, monkeypatch):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(coordinator.play_matches(genome_groups, None, 1)), daemon=True)
+    thread.start()
+
+    # Every match goes to the slow worker in one batch, then the worker dies
+    slow_worker = start_worker(coordinator, monkeypatch, play_match_slowly)
+    wait_for(lambda: coordinator.tasks.qsize() == 0)
+    kill_worker(slow_worker)
+
+    wait_for(lambda: coordinator.tasks.qsize() == NUM_MATCHES)
+    assert all(task.attempts == 1 for task in coordinator.tasks.queue)
+
+    start_worker(coordinator, monkeypatch, play_match_quickly)
+    thread.join(TIMEOUT)
+    assert [sorted(result.fitnesses) for result in results[0]] == [sorted(genome_id for genome_id, _ in group) for group in genome_groups]
+
+def test_failing_match_is_reported_without_killing_the_worker(coordinator, genome_groups, monkeypatch):
+    worker = start_worker(coordinator, monkeypatch, play_match_badly)
+
+    with pytest.raises(RuntimeError, match="Bad match"):
+        coordinator.play_matches(genome_groups, None, 1)
+    assert worker.is_alive()
+
+    # The same worker carries on with the next generation
+    results = coordinator.play_matches(genome_groups[1:], None, 1)
+    assert len(results) == NUM_MATCHES - 1
+
+def test_bad_key_does_not_stop_workers_joining(coordinator, genome_groups, monkeypatch):
+    with pytest.raises(AuthenticationError):
+        Client(coordinator.address, authkey=b"wrong")
+
+    # A client which connects and says nothing mustn't block others either
+    silent = socket.create_connection(coordinator.address)
+
+    start_worker(coordinator, monkeypatch, play_match_quickly)
+    assert len(play_matches(coordinator, genome_groups)) == NUM_MATCHES
+    silent.close()
+
+def test_workers_lost_while_idle_use_no_attempts(coordinator, genome_groups, monkeypatch):
+    # Each big enough to take every match, so if handing matches to them counted as attempts they'd use them all up
+    for i in range(distributed.MAX_TASK_ATTEMPTS):
+        conn = Client(coordinator.address, authkey=coordinator.authkey)
+        conn.send(("register", f"idle-{i}", NUM_MATCHES))
+        conn.close()
+    time.sleep(0.5)
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(play_matches(coordinator, genome_groups)), daemon=True)
+    thread.start()
+    time.sleep(0.5)
+
+    start_worker(coordinator, monkeypatch, play_match_quickly)
+    thread.join(TIMEOUT)
+    assert len(results[0]) == NUM_MATCHES
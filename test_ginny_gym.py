@@ -0,0 +1,46 @@
+"""
+Early stopping of matches in ginny_gym, on simulated game results
+"""
+import random
+
+import pytest
+
+import ginny_gym
+from ginny_gym import GameResult
+
+
+NUM_MATCHES = 1000
+LONG_MATCH_GAMES = 12
+
+
+def play_simulated_match(rng:random.Random, num_players:int, num_games:int, winner:int|None=None) -> int:
+    """
+    Number of games played before the match was decided, or num_games if it never was. Each game is won by the given seat,
+    or a random one, and the other seats score 1-100 points as in rummy, where the winner scores nothing.
+    """
+    results = []
+    for _ in range(num_games):
+        game_winner = rng.randrange(num_players) if winner is None else winner
+        results.append(GameResult([0 if seat == game_winner else rng.randint(1, 100) for seat in range(num_players)], 50))
+
+        if ginny_gym.is_match_decided(results, num_games):
+            break
+
+    return len(results)
+
+
+@pytest.mark.parametrize("differences, p_value", [([5], 0.5), ([1, 1], 0.25), ([3, -1], 0.5), ([-2, -2], 1.0), ([4, 1, 2], 0.125)])
+def test_sign_flip_p_value(differences, p_value):
+    assert ginny_gym.get_sign_flip_p_value(differences) == p_value
+
+@pytest.mark.parametrize("num_players", [2, 4])
+@pytest.mark.parametrize("num_games", [ginny_gym.NUM_GAMES_PER_MATCH, LONG_MATCH_GAMES])
+def test_equal_players_rarely_stop_early(num_players, num_games):
+    rng = random.Random(num_players * 100 + num_games)
+    num_early = sum(play_simulated_match(rng, num_players, num_games) < num_games for _ in range(NUM_MATCHES))
+
+    assert num_early / NUM_MATCHES <= ginny_gym.MATCH_DECISION_ALPHA
+
+def test_one_sided_long_match_stops_early():
+    rng = random.Random(0)
+    assert play_simulated_match(rng, 2, LONG_MATCH_GAMES, winner=0) < LONG_MATCH_GAMES
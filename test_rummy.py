@@ -0,0 +1,52 @@
+"""
+Player views of a rummy.Game can be read but not used to change the game
+"""
+import random
+
+import pytest
+
+import agents
+import rummy
+
+
+@pytest.fixture
+def game() -> rummy.Game:
+    random.seed(0)
+    game = rummy.Game(3, human_readable=False, strict=False)
+    players = [agents.make_agent("greedy", game, player) for player in range(3)]
+    game.shuffle()
+    game.deal()
+
+    # Play into the game, so there's some knowledge and a table
+    for _ in range(12):
+        players[game.whose_go].take_turn()
+    return game
+
+
+def test_unseen_cards_have_no_public_state(game):
+    unseen_cards = game.get_view(0).unseen_cards
+    before = list(unseen_cards)
+
+    assert not [name for name in dir(unseen_cards) if not name.startswith("_") and name != "copy"]
+    with pytest.raises(AttributeError):
+        unseen_cards.extra = None
+
+    unseen_cards.copy().clear()
+    assert list(unseen_cards) == before
+
+def test_partial_melds_are_immutable(game):
+    view = game.get_view(game.whose_go)
+    assert len(view.partial_melds) > 0
+
+    for cards, completing_cards in view.partial_melds:
+        assert isinstance(cards, tuple) and isinstance(completing_cards, tuple)
+    with pytest.raises(TypeError):
+        view.partial_melds[0] = None
+
+def test_legal_actions_are_frozen(game):
+    game.draw(game.whose_go, from_deck=True)
+    legal_actions = game.get_view(game.whose_go).legal_actions
+
+    with pytest.raises(AttributeError):
+        legal_actions.melds = ()
+    assert isinstance(legal_actions.melds, tuple)
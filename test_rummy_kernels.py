@@ -0,0 +1,42 @@
+"""
+The Numba kernels agree with the pure Python reference, compiled or not
+"""
+import warnings
+
+import pytest
+
+import rummy
+import rummy_kernels
+
+
+NUM_CASES = 5000
+
+KERNELS = {"compiled": rummy_kernels.meld_type_kernel} if rummy_kernels.NUMBA_AVAILABLE else {}
+# Without Numba the kernel is already the plain function
+KERNELS["uncompiled"] = getattr(rummy_kernels.meld_type_kernel, "py_func", rummy_kernels.meld_type_kernel)
+
+
+@pytest.mark.parametrize("kernel", KERNELS.values(), ids=KERNELS.keys())
+def test_kernel_matches_reference(kernel, monkeypatch):
+    monkeypatch.setattr(rummy_kernels, "meld_type_kernel", kernel)
+    assert rummy_kernels.check_parity(NUM_CASES) == 0
+
+def test_empty_and_duplicate_cards():
+    assert rummy_kernels.is_valid_meld([]) == (False, None)
+    with pytest.raises(rummy.BadMeldError):
+        rummy_kernels.is_valid_meld(["3♣", "3♣", "3♦"])
+
+def test_numba_backend_swaps_in_kernel():
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        game = rummy.Game(2, backend="numba")
+
+    if rummy_kernels.NUMBA_AVAILABLE:
+        assert game.backend == "numba"
+        assert game.is_valid_meld is rummy_kernels.is_valid_meld
+        assert not caught
+    else:
+        assert game.backend == "python"
+        assert any("Numba" in str(warning.message) for warning in caught)
+
+    assert rummy.Game(2).is_valid_meld != rummy_kernels.is_valid_meld